@@ -0,0 +1,562 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import builtins
+import contextlib
+import io
+
+import 解锁
+
+# 假 adb：-s 选设备；devices 列出未进入 fastboot 的设备；shell 带命令时单次执行，
+# 不带命令时作为常驻会话逐行读取命令。每次往返都按配置加入延迟、抖动和失败
+FAKE_ADB = r'''#!PYTHON
+import os, sys, json, time, random, subprocess
+config = json.load(open(os.environ['DM_FAKE_CONFIG'], encoding='utf-8'))
+state_dir = config['state_dir']
+
+def round_trip():
+    delay = config['latency_ms'] + random.uniform(-config['jitter_ms'], config['jitter_ms'])
+    time.sleep(max(delay, 0) / 1000)
+    return random.random() >= config['failure_rate']
+
+def in_fastboot(serial):
+    return os.path.exists(os.path.join(state_dir, serial))
+
+def device_env(serial):
+    env = dict(os.environ, DM_FAKE_SERIAL=serial)
+    env['PATH'] = config['tool_dir'] + os.pathsep + env['PATH']
+    return env
+
+args = sys.argv[1:]
+serials = config['serials']
+serial = None
+if args[:1] == ['-s']:
+    serial, args = args[1], args[2:]
+online = [s for s in serials if not in_fastboot(s)]
+
+if args[:1] in (['start-server'], ['kill-server']):
+    sys.exit(0)
+if args[:1] == ['devices']:
+    round_trip()
+    print('List of devices attached')
+    for s in online:
+        print(f'{s}\tdevice')
+    print()
+    sys.exit(0)
+
+if serial is None:
+    if len(online) != 1:
+        print('error: more than one device/emulator' if online else 'error: no devices/emulators found', file=sys.stderr)
+        sys.exit(1)
+    serial = online[0]
+if serial not in online:
+    print(f"error: device '{serial}' not found", file=sys.stderr)
+    sys.exit(1)
+
+if args[:2] == ['reboot', 'bootloader']:
+    round_trip()
+    with open(os.path.join(state_dir, serial), 'w') as f:
+        f.write(str(time.time() + config['reboot_delay']))
+    sys.exit(0)
+
+if args[:1] in (['shell'], ['exec-out']) and len(args) > 1:
+    if not round_trip():
+        print('error: device offline', file=sys.stderr)
+        sys.exit(1)
+    result = subprocess.run(['sh', '-c', ' '.join(args[1:])], env=device_env(serial))
+    sys.exit(result.returncode)
+
+if args[:1] == ['shell']:
+    shell = subprocess.Popen(['sh'], stdin=subprocess.PIPE, env=device_env(serial))
+    for line in sys.stdin.buffer:
+        if not round_trip():
+            shell.kill()
+            sys.exit(1)
+        shell.stdin.write(line)
+        shell.stdin.flush()
+    shell.stdin.close()
+    sys.exit(shell.wait())
+
+print(f'unsupported: {args}', file=sys.stderr)
+sys.exit(1)
+'''
+
+# 假 fastboot：adb reboot bootloader 之后，过了重启延迟才出现在 fastboot devices 里
+FAKE_FASTBOOT = r'''#!PYTHON
+import os, sys, json, time, random
+config = json.load(open(os.environ['DM_FAKE_CONFIG'], encoding='utf-8'))
+state_dir = config['state_dir']
+delay = config['latency_ms'] + random.uniform(-config['jitter_ms'], config['jitter_ms'])
+time.sleep(max(delay, 0) / 1000)
+
+def ready():
+    serials = []
+    for serial in config['serials']:
+        path = os.path.join(state_dir, serial)
+        if os.path.exists(path) and time.time() >= float(open(path).read() or 0):
+            serials.append(serial)
+    return serials
+
+args = sys.argv[1:]
+serial = None
+if args[:1] == ['-s']:
+    serial, args = args[1], args[2:]
+
+if args[:1] == ['devices']:
+    for s in ready():
+        print(f'{s}\tfastboot')
+    sys.exit(0)
+if args[:2] == ['getvar', 'all'] and serial in ready():
+    # 真实的 fastboot 把 getvar 的结果写到 stderr
+    props = config['devices'][serial]['props']
+    lines = [f'product: {props["ro.product.device"]}', f'serialno: {serial}', 'secure: yes',
+             'unlocked: no', 'version-bootloader: unknown', 'current-slot: a',
+             'partition-size:userdata: 0x1c5e5fb000', 'partition-type:userdata: f2fs']
+    for line in lines:
+        print(f'(bootloader) {line}', file=sys.stderr)
+    print('all: ', file=sys.stderr)
+    print('Finished. Total time: 0.020s', file=sys.stderr)
+    sys.exit(0)
+if args[:1] == ['reboot']:
+    for s in ([serial] if serial else ready()[:1]):
+        if os.path.exists(os.path.join(state_dir, s)):
+            os.remove(os.path.join(state_dir, s))
+    sys.exit(0)
+sys.exit(0)
+'''
+
+# 设备端工具：按 DM_FAKE_SERIAL 返回每台设备各自的固定内容
+FAKE_GETPROP = r'''#!PYTHON
+import os, sys, json
+config = json.load(open(os.environ['DM_FAKE_CONFIG'], encoding='utf-8'))
+props = config['devices'][os.environ['DM_FAKE_SERIAL']]['props']
+if len(sys.argv) > 1:
+    print(props.get(sys.argv[1], ''))
+else:
+    for key, value in props.items():
+        print(f'[{key}]: [{value}]')
+'''
+
+FAKE_DUMPSYS = r'''#!PYTHON
+import os, sys, json
+config = json.load(open(os.environ['DM_FAKE_CONFIG'], encoding='utf-8'))
+device = config['devices'][os.environ['DM_FAKE_SERIAL']]
+
+def battery():
+    print('Current Battery Service state:')
+    print('  AC powered: false')
+    print('  USB powered: true')
+    print('  status: 2')
+    print('  health: 2')
+    print(f"  level: {device['battery']}")
+    print('  scale: 100')
+    print('  voltage: 4120')
+    print('  temperature: 312')
+
+def iphonesubinfo():
+    print('Phone Subscriber Info:')
+    print('  Phone Type = GSM')
+
+services = {'battery': battery, 'iphonesubinfo': iphonesubinfo}
+service = sys.argv[1] if len(sys.argv) > 1 else ''
+if service in services:
+    services[service]()
+elif not service:
+    # 不带参数时与真实 dumpsys 一样依次输出所有服务，另加一段较大的填充内容
+    print('Currently running services:')
+    for name in services:
+        print(f'  {name}')
+    # 与新版 dumpsys 一样，部分服务的标题带优先级
+    priorities = {'activity': 'CRITICAL ', 'battery': 'HIGH '}
+    for name in ['activity'] + list(services):
+        print('-' * 79)
+        print(f'DUMP OF SERVICE {priorities.get(name, "")}{name}:')
+        if name == 'activity':
+            for i in range(20000):
+                print(f'  * ServiceRecord{{{i:08x} u0 com.example/.Service{i}}}')
+        else:
+            services[name]()
+        print(f'--------- 0.002s was the duration of dumpsys {name}, ending at: 2024-01-02 10:00:00')
+'''
+
+FAKE_SERVICE = r'''#!PYTHON
+import os, sys, json
+config = json.load(open(os.environ['DM_FAKE_CONFIG'], encoding='utf-8'))
+device = config['devices'][os.environ['DM_FAKE_SERIAL']]
+args = sys.argv[1:]
+
+def parcel(text):
+    data = (0).to_bytes(4, 'little') + len(text).to_bytes(4, 'little') + text.encode('utf-16-le')
+    data += b'\0' * (-len(data) % 4)
+    words = [int.from_bytes(data[i:i + 4], 'little') for i in range(0, len(data), 4)]
+    lines = ['Result: Parcel(']
+    for i in range(0, len(words), 4):
+        lines.append(f'  0x{i * 4:08x}: ' + ' '.join(f'{w:08x}' for w in words[i:i + 4]) + " '................'")
+    return '\n'.join(lines) + ')'
+
+if args[:3] == ['call', 'iphonesubinfo', '3'] and len(args) >= 5:
+    slot = int(args[4])
+    imeis = device['imeis']
+    print(parcel(imeis[slot]) if slot < len(imeis) else "Result: Parcel(ffffffe8 00000000 '........')")
+else:
+    print("Result: Parcel(ffffffb4 00000000 '........')")
+'''
+
+
+def luhn_digit(digits):
+    """计算 Luhn 校验位"""
+    total = 0
+    for i, digit in enumerate(int(c) for c in reversed(digits)):
+        if i % 2 == 0:
+            digit = digit * 2 - 9 if digit > 4 else digit * 2
+        total += digit
+    return str((10 - total % 10) % 10)
+
+
+def make_devices(count):
+    """生成每台假设备的属性、IMEI 和电量"""
+    devices = {}
+    for i in range(count):
+        serial = f'BENCH{i:04d}'
+        imeis = []
+        for slot in range(2):
+            body = f'86{i:06d}{slot:06d}'
+            imeis.append(body + luhn_digit(body))
+        devices[serial] = {
+            'props': {
+                'ro.product.model': 'ELS-AN00',
+                'ro.product.device': 'HWELS',
+                'ro.product.brand': 'HUAWEI',
+                'ro.product.cpu.abi': 'arm64-v8a',
+                'ro.serialno': f'JQYNW1981{i:07d}',
+                'ro.build.version.release': '12',
+                'ro.build.display.id': 'ELS-AN00 4.0.0.200(C00E200R2P3)',
+                'ro.build.date': 'Tue Jan  2 10:00:00 CST 2024',
+                'ro.build.fingerprint': 'HUAWEI/ELS-AN00/HWELS:12/HUAWEIELS-AN00/4.0.0.200:user/release-keys',
+                'ro.boot.bootreason': 'normal',
+            },
+            'imeis': imeis,
+            'battery': 50 + i % 50,
+        }
+    return devices
+
+
+class FakeBench:
+    """把假 adb/fastboot 放到 PATH 最前面的测试环境"""
+
+    def __init__(self, device_count, latency_ms, jitter_ms, failure_rate, reboot_delay):
+        self.root = tempfile.mkdtemp(prefix='dm_bench_')
+        self.bin_dir = os.path.join(self.root, 'bin')
+        self.tool_dir = os.path.join(self.root, 'device_bin')
+        self.state_dir = os.path.join(self.root, 'state')
+        for path in (self.bin_dir, self.tool_dir, self.state_dir):
+            os.makedirs(path)
+
+        devices = make_devices(device_count)
+        self.config = {
+            'serials': list(devices),
+            'devices': devices,
+            'latency_ms': latency_ms,
+            'jitter_ms': jitter_ms,
+            'failure_rate': failure_rate,
+            'reboot_delay': reboot_delay,
+            'state_dir': self.state_dir,
+            'tool_dir': self.tool_dir,
+        }
+        self.config_path = os.path.join(self.root, 'config.json')
+        with open(self.config_path, 'w', encoding='utf-8') as f:
+            json.dump(self.config, f)
+
+        self.write_script(self.bin_dir, 'adb', FAKE_ADB)
+        self.write_script(self.bin_dir, 'fastboot', FAKE_FASTBOOT)
+        self.write_script(self.tool_dir, 'getprop', FAKE_GETPROP)
+        self.write_script(self.tool_dir, 'dumpsys', FAKE_DUMPSYS)
+        self.write_script(self.tool_dir, 'service', FAKE_SERVICE)
+
+    def write_script(self, directory, name, source):
+        path = os.path.join(directory, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(source.replace('#!PYTHON', f'#!{sys.executable}', 1))
+        os.chmod(path, 0o755)
+
+    def __enter__(self):
+        self.saved_env = {key: os.environ.get(key) for key in ('PATH', 'DM_FAKE_CONFIG')}
+        os.environ['PATH'] = self.bin_dir + os.pathsep + os.environ['PATH']
+        os.environ['DM_FAKE_CONFIG'] = self.config_path
+        return self
+
+    def __exit__(self, *exc):
+        for key, value in self.saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def reset_states(self):
+        """所有设备回到正常开机状态"""
+        for name in os.listdir(self.state_dir):
+            os.remove(os.path.join(self.state_dir, name))
+
+
+def new_manager(serial=None):
+    """基准测试用的 DeviceManager：不连接本机真实的 adb server"""
+    manager = 解锁.DeviceManager(mode='adb', serial=serial, no_delay=True)
+    manager.adb_client = None
+    return manager
+
+
+def percentile(samples, pct):
+    """最近秩法百分位数"""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def summarize(name, samples, extra=None):
+    result = {
+        'name': name,
+        'count': len(samples),
+        'p50': percentile(samples, 50),
+        'p90': percentile(samples, 90),
+        'p99': percentile(samples, 99),
+        'max': max(samples) if samples else 0.0,
+    }
+    result.update(extra or {})
+    return result
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def bench_scan(bench, rounds):
+    """单台设备完整扫描（每轮每台设备一个新的 DeviceManager）"""
+    samples = []
+    for _ in range(rounds):
+        for serial in bench.config['serials']:
+            manager = new_manager(serial)
+            samples.append(timed(lambda: manager.collect_scan(verbose=False)))
+            manager.close_shell_session()
+    return summarize('scan_device_info', samples)
+
+
+def bench_first_field(bench, rounds):
+    """流式扫描中第一项结果出现的耗时"""
+    samples = []
+    for _ in range(rounds):
+        for serial in bench.config['serials']:
+            manager = new_manager(serial)
+            start = time.perf_counter()
+            first = []
+            manager.collect_scan(verbose=False, on_field=lambda *event: first or first.append(time.perf_counter()))
+            samples.append(first[0] - start)
+            manager.close_shell_session()
+    return summarize('scan_first_field', samples)
+
+
+def bench_imei(bench, rounds):
+    """IMEI 获取（含属性快照）"""
+    samples = []
+    for _ in range(rounds):
+        for serial in bench.config['serials']:
+            manager = new_manager(serial)
+            samples.append(timed(lambda: (manager.load_prop_snapshot(), manager.get_imei_numbers())))
+            manager.close_shell_session()
+    return summarize('get_imei_numbers', samples)
+
+
+def bench_detect(bench, rounds):
+    """设备模式检测（detect_devices，一次探测所有设备的模式）"""
+    manager = new_manager()
+    samples = [timed(manager.detect_devices) for _ in range(rounds)]
+    return summarize('detect_devices', samples)
+
+
+def bench_fastboot_scan(bench, rounds, workers):
+    """Fastboot 模式扫描（每台设备一次 getvar all，多台并行）"""
+    for serial in bench.config['serials']:
+        with open(os.path.join(bench.state_dir, serial), 'w') as f:
+            f.write('0')
+    samples = []
+    try:
+        for _ in range(rounds):
+            manager = new_manager()
+            samples.append(timed(lambda: manager.scan_fastboot_fleet(max_workers=workers, verbose=False)))
+    finally:
+        bench.reset_states()
+    return summarize('scan_fastboot_fleet', samples)
+
+
+def bench_fleet(bench, rounds, workers):
+    """多设备并行扫描吞吐量"""
+    samples = []
+    for _ in range(rounds):
+        manager = new_manager()
+        with contextlib.redirect_stdout(io.StringIO()):
+            samples.append(timed(lambda: manager.scan_fleet(max_workers=workers)))
+    device_count = len(bench.config['serials'])
+    throughput = device_count / percentile(samples, 50) if samples else 0.0
+    return summarize('fleet_scan', samples, {'devices_per_second': throughput})
+
+
+def bench_dumpsys_bulk(bench, rounds):
+    """批量 dumpsys 扫描（同时录制），电池信息必须取到，录制的档案必须能完整回放"""
+    samples = []
+    capture_dir = os.path.join(bench.root, 'captures')
+    for _ in range(rounds):
+        for serial in bench.config['serials']:
+            shutil.rmtree(capture_dir, ignore_errors=True)
+            manager = new_manager(serial)
+            manager.dumpsys_bulk = []
+            manager.capture_dir = capture_dir
+            manager.use_static_cache = False
+            samples.append(timed(lambda: manager.collect_scan(verbose=False)))
+            manager.close_shell_session()
+            missing = [item for item in ('电池信息', '电池温度', '电池健康') if item not in manager.device_info]
+            live = [r['command'] for r in manager.tracer.records if r['command'] == 'dumpsys battery']
+            if missing or live:
+                raise RuntimeError(f"{serial}: 电池信息没有从批量 dumpsys 中取到（缺少 {missing}，单独执行 {live}）")
+            replay = manager.scan_replay(os.path.join(capture_dir, os.listdir(capture_dir)[0]))
+            if replay['error'] or replay['device_info'] != manager.device_info:
+                raise RuntimeError(f"{serial}: 回放结果与扫描不一致: {replay['error']}")
+    return summarize('scan_dumpsys_bulk', samples)
+
+
+def bench_stage(bench, rounds, workers):
+    """批量进入 Fastboot（第一台设备开始时就已在 Fastboot），每台设备都必须到 ready"""
+    samples = []
+    try:
+        for _ in range(rounds):
+            bench.reset_states()
+            with open(os.path.join(bench.state_dir, bench.config['serials'][0]), 'w') as f:
+                f.write('0')
+            stager = 解锁.FleetStager(new_manager(), bench.config['serials'], workers)
+            start = time.perf_counter()
+            states = stager.run()
+            samples.append(time.perf_counter() - start)
+            not_ready = {serial: state for serial, state in states.items() if state != 'ready'}
+            if not_ready:
+                raise RuntimeError(f"批量进入 Fastboot 未全部就绪: {not_ready}")
+    finally:
+        bench.reset_states()
+    return summarize('stage_fleet', samples)
+
+
+def bench_unlock(bench, rounds):
+    """解锁流程（自动进入 fastboot → 确认 → 输入解锁码），只用第一台设备"""
+    answers = [('自动进入Fastboot', 'y'), ('确认要解锁', 'yes'), ('解锁码', '0123456789ABCDEF'),
+               ('重启到系统', 'n'), ('请选择', '1')]
+
+    def scripted_input(prompt=''):
+        for key, answer in answers:
+            if key in prompt:
+                return answer
+        return ''
+
+    serials = bench.config['serials']
+    # 解锁流程只针对一台设备：其余设备在这项测试中暂时不出现
+    bench.config['serials'] = serials[:1]
+    with open(bench.config_path, 'w', encoding='utf-8') as f:
+        json.dump(bench.config, f)
+
+    samples = []
+    original_input = builtins.input
+    builtins.input = scripted_input
+    try:
+        for _ in range(rounds):
+            bench.reset_states()
+            manager = new_manager()
+            manager.clear_screen = lambda: None
+            with contextlib.redirect_stdout(io.StringIO()):
+                samples.append(timed(manager.unlock_bootloader))
+    finally:
+        builtins.input = original_input
+        bench.config['serials'] = serials
+        with open(bench.config_path, 'w', encoding='utf-8') as f:
+            json.dump(bench.config, f)
+        bench.reset_states()
+    return summarize('unlock_bootloader', samples)
+
+
+def print_report(results, args):
+    print("═" * 72)
+    print(f"基准测试：{args.devices} 台假设备，延迟 {args.latency_ms}±{args.jitter_ms}ms，"
+          f"失败率 {args.failure_rate:.0%}，{args.rounds} 轮")
+    print("═" * 72)
+    print(f"{'项目':<32}{'次数':>6}{'p50':>9}{'p90':>9}{'p99':>9}{'最大':>9}")
+    print("-" * 72)
+    for r in results:
+        print(f"{r['name']:<32}{r['count']:>6}{r['p50']:>8.3f}s{r['p90']:>8.3f}s{r['p99']:>8.3f}s{r['max']:>8.3f}s")
+    for r in results:
+        if 'devices_per_second' in r:
+            print(f"\n多设备扫描吞吐量: {r['devices_per_second']:.2f} 台/秒（{args.workers} 个并发）")
+    print("═" * 72)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="设备管理工具基准测试（使用假 adb/fastboot，无需真机）")
+    parser.add_argument('--devices', type=int, default=4, help="假设备数量（默认 4）")
+    parser.add_argument('--latency-ms', type=float, default=20, help="每次 adb/fastboot 往返的延迟毫秒数（默认 20）")
+    parser.add_argument('--jitter-ms', type=float, default=5, help="延迟抖动毫秒数（默认 5）")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="每次往返失败的概率 0~1（默认 0）")
+    parser.add_argument('--reboot-delay', type=float, default=1.0, help="重启到 fastboot 所需秒数（默认 1）")
+    parser.add_argument('--rounds', type=int, default=3, help="每项测试的轮数（默认 3）")
+    parser.add_argument('--workers', type=int, default=解锁.DeviceManager.FLEET_MAX_WORKERS,
+                        help="多设备扫描的并发数")
+    parser.add_argument('--only', default='scan,first,imei,detect,fleet,fastboot,dumpsys,stage,unlock',
+                        help="要运行的测试，逗号分隔（scan,first,imei,detect,fleet,fastboot,dumpsys,stage,unlock）")
+    parser.add_argument('--json', metavar='FILE', default=None, help="把结果另存为 JSON")
+    parser.add_argument('--seed', type=int, default=None, help="随机种子（抖动和失败）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if os.name == 'nt':
+        print("基准测试依赖可执行的脚本形式的假 adb/fastboot，目前仅支持 Linux/macOS")
+        return 1
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    selected = [name.strip() for name in args.only.split(',') if name.strip()]
+    benches = {
+        'scan': lambda bench: bench_scan(bench, args.rounds),
+        'first': lambda bench: bench_first_field(bench, args.rounds),
+        'imei': lambda bench: bench_imei(bench, args.rounds),
+        'detect': lambda bench: bench_detect(bench, args.rounds),
+        'fleet': lambda bench: bench_fleet(bench, args.rounds, args.workers),
+        'fastboot': lambda bench: bench_fastboot_scan(bench, args.rounds, args.workers),
+        'dumpsys': lambda bench: bench_dumpsys_bulk(bench, args.rounds),
+        'stage': lambda bench: bench_stage(bench, args.rounds, args.workers),
+        'unlock': lambda bench: bench_unlock(bench, args.rounds),
+    }
+
+    results = []
+    with FakeBench(args.devices, args.latency_ms, args.jitter_ms, args.failure_rate, args.reboot_delay) as bench:
+        for name in selected:
+            if name not in benches:
+                print(f"未知测试: {name}")
+                return 2
+            print(f"正在测试 {name}...")
+            results.append(benches[name](bench))
+
+    print_report(results, args)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到: {os.path.abspath(args.json)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
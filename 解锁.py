@@ -1,19 +1,1341 @@
 import os
 import sys
+import argparse
+import shutil
+import shlex
+import json
+import contextlib
+import csv
+import gzip
 import subprocess
 import re
 import hashlib
+import mmap
+import tempfile
+import sqlite3
 import time
+import queue
+import threading
+import uuid
+import asyncio
+import socket
+import struct
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from datetime import datetime
 
-class DeviceManager:
+try:
+    import numpy as np  # 可选：批量解析 SN 时使用向量化运算，没有时退回纯 Python
+except ImportError:
+    np = None
+
+class AdbProtocolError(Exception):
+    """adb server 返回 FAIL 或协议数据异常"""
+
+class DeviceCommandError(Exception):
+    """设备端命令失败：kind 为错误类别，attempts 为已尝试的次数"""
+    
+    # adb 报错文本 → 错误类别（按顺序匹配）
+    PATTERNS = [
+        ('unauthorized', r'unauthorized'),
+        ('offline', r'device offline'),
+        ('not_found', r"device '.*' not found|device not found|no devices/emulators found"),
+        ('protocol', r'protocol fault|^closed$|提前关闭了连接'),
+    ]
+    LABELS = {
+        'unauthorized': "设备未授权",
+        'offline': "设备离线",
+        'not_found': "设备未找到",
+        'protocol': "adb 协议错误",
+        'circuit_open': "设备已熔断",
+    }
+    TRANSIENT_KINDS = ('offline', 'protocol')  # 值得重试的错误：USB 抖动、连接被重置
+    
+    def __init__(self, kind, message, command=None, attempts=1):
+        super().__init__(f"{self.LABELS.get(kind, kind)}: {message}")
+        self.kind = kind
+        self.message = message
+        self.command = command
+        self.attempts = attempts
+    
+    @property
+    def transient(self):
+        return self.kind in self.TRANSIENT_KINDS
+    
+    @classmethod
+    def classify(cls, message):
+        """识别 adb 报错文本的类别，不是设备连接类错误时返回 None"""
+        for kind, pattern in cls.PATTERNS:
+            if re.search(pattern, message.strip(), re.IGNORECASE | re.MULTILINE):
+                return kind
+        return None
+    
+    def as_dict(self):
+        return {'kind': self.kind, 'message': self.message, 'command': self.command, 'attempts': self.attempts}
+
+class CircuitBreaker:
+    """单台设备的熔断器：连续 threshold 次失败（未授权、未找到时一次即可）后断开，
+    冷却 cooldown 秒内该设备的命令直接失败；冷却后放行命令试探，再失败一次重新断开"""
+    
+    def __init__(self, threshold=5, cooldown=30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self.lock = threading.Lock()
+    
+    def allow(self):
+        """是否放行一条命令"""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.opened_at = None
+            self.failures = self.threshold - 1
+            return True
+    
+    @property
+    def is_open(self):
+        with self.lock:
+            return self.opened_at is not None
+    
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+    
+    def record_failure(self, error):
+        with self.lock:
+            self.failures += 1
+            self.last_error = error
+            if self.failures >= self.threshold or not error.transient:
+                self.opened_at = time.monotonic()
+
+class AdbClient:
+    """adb server 智能套接字协议客户端：直接连接 localhost:5037，不启动 adb 进程"""
+    
+    # shell v2 数据包类型
+    SHELL_STDOUT = 1
+    SHELL_STDERR = 2
+    SHELL_EXIT = 3
+    
+    AVAILABILITY_TTL = 5  # server 可用性检查结果的缓存秒数
+    
+    def __init__(self, host='127.0.0.1', port=5037, timeout=60):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.features_cache = {}
+        self.available = None
+        self.checked_at = 0
+    
+    def connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+    
+    def _read_exact(self, sock, size):
+        data = b''
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise AdbProtocolError("adb server 提前关闭了连接")
+            data += chunk
+        return data
+    
+    def _read_block(self, sock):
+        """读取 4 位十六进制长度前缀的数据块"""
+        size = int(self._read_exact(sock, 4), 16)
+        return self._read_exact(sock, size).decode('utf-8', errors='ignore')
+    
+    def _read_all(self, sock):
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+    
+    def send_request(self, sock, request):
+        """发送一条请求并检查 OKAY/FAIL 应答"""
+        data = request.encode('utf-8')
+        sock.sendall(f'{len(data):04x}'.encode('ascii') + data)
+        status = self._read_exact(sock, 4)
+        if status == b'OKAY':
+            return
+        if status == b'FAIL':
+            raise AdbProtocolError(self._read_block(sock))
+        raise AdbProtocolError(f"未知应答: {status!r}")
+    
+    def host_query(self, request):
+        """执行 host: 请求并返回应答数据（server 应答后即关闭连接）"""
+        with self.connect() as sock:
+            self.send_request(sock, request)
+            return self._read_block(sock)
+    
+    def is_available(self):
+        """adb server 是否可以直接连接（结果缓存几秒，避免每条命令都探测）"""
+        if self.available is None or time.monotonic() - self.checked_at > self.AVAILABILITY_TTL:
+            try:
+                self.host_query('host:version')
+                self.available = True
+            except (OSError, AdbProtocolError):
+                self.available = False
+            self.checked_at = time.monotonic()
+        return self.available
+    
+    def devices(self):
+        """返回 [(序列号, 状态), ...]"""
+        return self.parse_device_list(self.host_query('host:devices'))
+    
+    def parse_device_list(self, text):
+        devices = []
+        for line in text.split('\n'):
+            parts = line.split()
+            if len(parts) >= 2:
+                devices.append((parts[0], parts[1]))
+        return devices
+    
+    def open_track_devices(self):
+        """打开 host:track-devices 长连接，之后每次设备变化 server 都会推送完整列表"""
+        sock = self.connect()
+        try:
+            self.send_request(sock, 'host:track-devices')
+        except:
+            sock.close()
+            raise
+        sock.settimeout(None)
+        return sock
+    
+    def read_device_list(self, sock):
+        """读取 track-devices 推送的一次设备列表"""
+        return self.parse_device_list(self._read_block(sock))
+    
+    def features(self, serial=None):
+        """设备支持的特性（如 shell_v2），按序列号缓存（查询失败不缓存，下次重新查询）"""
+        if serial not in self.features_cache:
+            request = f'host-serial:{serial}:features' if serial else 'host:features'
+            try:
+                self.features_cache[serial] = set(self.host_query(request).split(','))
+            except AdbProtocolError:
+                return set()
+        return self.features_cache[serial]
+    
+    def open_service(self, serial, service):
+        """切换到设备传输通道并打开设备端服务，返回已连接的套接字"""
+        sock = self.connect()
+        try:
+            self.send_request(sock, f'host:transport:{serial}' if serial else 'host:transport-any')
+            self.send_request(sock, service)
+        except:
+            sock.close()
+            raise
+        return sock
+    
+    def shell(self, serial, command, stats=None):
+        """执行一条设备端命令，返回 (输出, 退出码)；旧设备不支持 shell v2 时退出码为 None
+        
+        提供 stats 字典时写入建立连接的耗时 stats['spawn']
+        """
+        start = time.perf_counter()
+        if 'shell_v2' not in self.features(serial):
+            with self.open_service(serial, f'shell:{command}') as sock:
+                if stats is not None:
+                    stats['spawn'] = time.perf_counter() - start
+                return self._read_all(sock).decode('utf-8', errors='ignore'), None
+        
+        stdout, exit_code = [], None
+        with self.open_service(serial, f'shell,v2,raw:{command}') as sock:
+            if stats is not None:
+                stats['spawn'] = time.perf_counter() - start
+            while True:
+                try:
+                    header = self._read_exact(sock, 5)
+                except AdbProtocolError:
+                    break  # 连接关闭但没有收到退出码
+                packet_id, size = struct.unpack('<BI', header)
+                payload = self._read_exact(sock, size) if size else b''
+                if packet_id == self.SHELL_STDOUT:
+                    stdout.append(payload)
+                elif packet_id == self.SHELL_EXIT:
+                    exit_code = payload[0] if payload else 0
+                    break
+        return b''.join(stdout).decode('utf-8', errors='ignore'), exit_code
+    
+    def exec_to_file(self, serial, command, f):
+        """用 exec: 服务执行命令，原始输出分块直接写入文件对象 f，返回写入的字节数"""
+        total = 0
+        with self.open_service(serial, f'exec:{command}') as sock:
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    return total
+                f.write(chunk)
+                total += len(chunk)
+    
+    def open_shell_stream(self, serial):
+        """打开一个可持续写入命令的设备端 sh（无终端，输入直接转发给 sh）"""
+        sock = self.open_service(serial, 'shell:sh')
+        sock.settimeout(None)
+        return sock
+
+class DeviceRegistry:
+    """设备实时登记表：订阅 adb server 的 host:track-devices，并低频轮询 fastboot"""
+    
+    FASTBOOT_POLL_INTERVAL = 2  # fastboot 轮询间隔秒数
+    RECONNECT_DELAY_MAX = 5  # adb server 断开后重连的最长间隔秒数
+    
+    def __init__(self, client, fastboot_probe, fastboot_interval=None):
+        self.client = client
+        self.fastboot_probe = fastboot_probe  # fastboot_probe(timeout) -> [(序列号, 'fastboot'), ...]
+        self.fastboot_interval = fastboot_interval or self.FASTBOOT_POLL_INTERVAL
+        self.adb_states = {}
+        self.fastboot_serials = []
+        self.adb_live = False
+        self.fastboot_live = False
+        self.track_sock = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+    
+    def start(self):
+        """启动后台监听线程"""
+        for target in (self._track_adb, self._poll_fastboot):
+            threading.Thread(target=target, daemon=True).start()
+        return self
+    
+    def stop(self):
+        """停止监听"""
+        self.stopped.set()
+        if self.track_sock is not None:
+            try:
+                self.track_sock.close()
+            except:
+                pass
+    
+    def _track_adb(self):
+        """后台线程：接收 adb server 推送的设备变化，断开后按退避间隔重连"""
+        delay = 0.5
+        while not self.stopped.is_set():
+            try:
+                self.track_sock = self.client.open_track_devices()
+                delay = 0.5
+                while not self.stopped.is_set():
+                    devices = self.client.read_device_list(self.track_sock)
+                    with self.lock:
+                        self.adb_states = dict(devices)
+                        self.adb_live = True
+            except (OSError, AdbProtocolError):
+                pass
+            finally:
+                if self.track_sock is not None:
+                    self.track_sock.close()
+                    self.track_sock = None
+                with self.lock:
+                    self.adb_states = {}
+                    self.adb_live = False
+            self.stopped.wait(delay)
+            delay = min(delay * 2, self.RECONNECT_DELAY_MAX)
+    
+    def _poll_fastboot(self):
+        """后台线程：低频轮询 fastboot devices"""
+        while not self.stopped.is_set():
+            try:
+                serials = [serial for serial, _ in self.fastboot_probe(self.fastboot_interval * 2)]
+            except subprocess.TimeoutExpired:
+                serials = None  # 本次超时，保留上一次结果
+            except OSError:
+                serials = []  # 未安装 fastboot
+            if serials is not None:
+                with self.lock:
+                    self.fastboot_serials = serials
+                    self.fastboot_live = True
+            self.stopped.wait(self.fastboot_interval)
+    
+    def adb_devices(self):
+        """当前 adb 设备 [(序列号, 状态), ...]；未连上 adb server 时返回 None"""
+        with self.lock:
+            return list(self.adb_states.items()) if self.adb_live else None
+    
+    def fastboot_devices(self):
+        """当前 fastboot 设备 [(序列号, 'fastboot'), ...]；还没轮询过时返回 None"""
+        with self.lock:
+            return [(serial, 'fastboot') for serial in self.fastboot_serials] if self.fastboot_live else None
+
+class ImeiCollector:
+    """IMEI 获取：所有候选来源拼成一个设备端脚本一次执行，并正确解析 service call 的 Parcel 输出"""
+    
+    # 可能保存 IMEI 的属性（直接从属性快照读取，不再单独执行 getprop）
+    PROPS = ['gsm.imei', 'ril.imei', 'ro.ril.oem.imei', 'persist.radio.imei',
+             'persist.radio.imei1', 'persist.radio.imei2', 'ril.gsm.imei']
+    
+    # service call iphonesubinfo 的候选调用，事务码随 Android 版本不同：
+    # 6.0~9: 3 = getDeviceIdForPhone(phoneId, callingPackage)，1 = getDeviceId(callingPackage)
+    # 5.x 及更早: 1 = getDeviceId()
+    SERVICE_CALLS = [
+        ('slot0', '3 i32 0 s16 com.android.shell'),
+        ('slot1', '3 i32 1 s16 com.android.shell'),
+        ('default', '1 s16 com.android.shell'),
+        ('legacy', '1'),
+    ]
+    
+    MARKER = '@@IMEI@@'
+    
+    def build_script(self):
+        """生成批量获取脚本：每个来源前输出一行分隔标记"""
+        parts = [f'echo {self.MARKER}dumpsys; dumpsys iphonesubinfo 2>/dev/null']
+        for label, args in self.SERVICE_CALLS:
+            parts.append(f'echo {self.MARKER}{label}; service call iphonesubinfo {args} 2>/dev/null')
+        return '; '.join(parts)
+    
+    def split_sections(self, output):
+        """按分隔标记拆分脚本输出，返回 {来源: 输出}"""
+        sections, current = {}, None
+        for line in output.split('\n'):
+            if line.startswith(self.MARKER):
+                current = line[len(self.MARKER):].strip()
+                sections[current] = []
+            elif current is not None:
+                sections[current].append(line)
+        return {label: '\n'.join(lines) for label, lines in sections.items()}
+    
+    def parse_parcel(self, output):
+        """解析 service call 返回的 Parcel 十六进制转储，返回其中的字符串（失败返回 None）
+        
+        格式示例：
+          Result: Parcel(
+            0x00000000: 00000000 0000000f 00360038 00390030 '........8.6.0.9.'
+        每个 32 位字按小端序存放；第一个字是异常码，第二个字是 UTF-16 字符数，之后是字符串
+        """
+        if 'Parcel' not in output:
+            return None
+        data = b''
+        for line in output.split('\n'):
+            line = line.split("'")[0].replace('Result: Parcel(', '')
+            line = re.sub(r'^\s*0x[0-9a-fA-F]+:', '', line)
+            for word in line.split():
+                if re.fullmatch(r'[0-9a-fA-F]{8}', word):
+                    data += int(word, 16).to_bytes(4, 'little')
+        
+        if len(data) < 8:
+            return None
+        exception_code, length = struct.unpack('<ii', data[:8])
+        if exception_code != 0 or length < 0 or len(data) < 8 + length * 2:
+            return None
+        return data[8:8 + length * 2].decode('utf-16-le', errors='ignore')
+    
+    def luhn_valid(self, number):
+        """IMEI 校验位（Luhn 算法）"""
+        total = 0
+        for i, digit in enumerate(int(c) for c in reversed(number)):
+            if i % 2 == 1:
+                digit = digit * 2 - 9 if digit > 4 else digit * 2
+            total += digit
+        return total % 10 == 0
+    
+    def collect(self, props, output):
+        """从属性快照和批量脚本输出中收集 IMEI，按卡槽顺序去重"""
+        candidates = []
+        sections = self.split_sections(output or '')
+        
+        # 指定卡槽的调用最可靠，且能区分卡1/卡2
+        for label in ('slot0', 'slot1'):
+            value = self.parse_parcel(sections.get(label, ''))
+            if value and re.fullmatch(r'\d{15}', value) and self.luhn_valid(value):
+                candidates.append(value)
+        
+        for prop in self.PROPS:
+            for value in (props or {}).get(prop, '').split(','):
+                value = value.strip()
+                if re.fullmatch(r'\d{14,15}', value):
+                    candidates.append(value[:15])
+        
+        for line in sections.get('dumpsys', '').split('\n'):
+            if 'Device ID' in line or 'IMEI' in line:
+                candidates.extend(re.findall(r'(?<!\d)(\d{15})(?!\d)', line))
+        
+        for label in ('default', 'legacy'):
+            value = self.parse_parcel(sections.get(label, ''))
+            if value and re.fullmatch(r'\d{15}', value) and self.luhn_valid(value):
+                candidates.append(value)
+        
+        imei_numbers = []
+        for imei in candidates:
+            if imei not in imei_numbers:
+                imei_numbers.append(imei)
+        return imei_numbers
+
+class CommandTracer:
+    """命令计时记录：每条命令的耗时、启动耗时、输出大小和退出码，可导出 Chrome trace 或 JSON 时间线"""
+    
     def __init__(self):
-        self.mode = None
+        self.records = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+    
+    def reset(self):
+        with self.lock:
+            self.records = []
+            self.origin = time.perf_counter()
+    
+    def record(self, command, serial, start, end, stats):
+        """记录一条命令（start/end 为 time.perf_counter() 的值）"""
+        with self.lock:
+            self.records.append({
+                'command': command,
+                'serial': serial or '',
+                'backend': stats.get('backend'),
+                'start': start - self.origin,
+                'wall': end - start,
+                'spawn': stats.get('spawn', 0.0),
+                'output_size': stats.get('output_size', 0),
+                'exit_code': stats.get('exit_code'),
+                'error': stats.get('error'),
+            })
+    
+    def slowest(self, count=5):
+        with self.lock:
+            return sorted(self.records, key=lambda r: r['wall'], reverse=True)[:count]
+    
+    def print_summary(self, count=5):
+        """显示最慢的几条命令"""
+        slowest = self.slowest(count)
+        if not slowest:
+            return
+        print(f"\n【最慢的探测】（共 {len(self.records)} 条命令）")
+        print("-" * 40)
+        for r in slowest:
+            command = r['command'] if len(r['command']) <= 40 else r['command'][:37] + "..."
+            serial = f"[{r['serial']}] " if r['serial'] else ''
+            print(f"{r['wall']:6.3f}s  启动 {r['spawn']:.3f}s  {r['output_size']:>6}B  "
+                  f"退出码 {r['exit_code']}  {serial}{command}")
+    
+    def export(self, path, fmt='chrome'):
+        """导出时间线：chrome 为 Trace Event 格式（chrome://tracing、Perfetto 可打开），json 为原始记录"""
+        with self.lock:
+            records = list(self.records)
+        
+        if fmt == 'json':
+            data = records
+        else:
+            threads = {}
+            events = []
+            for r in records:
+                tid = threads.setdefault(r['serial'] or 'local', len(threads) + 1)
+                events.append({
+                    'name': r['command'],
+                    'cat': r['backend'] or 'command',
+                    'ph': 'X',
+                    'ts': round(r['start'] * 1e6),
+                    'dur': round(r['wall'] * 1e6),
+                    'pid': 1,
+                    'tid': tid,
+                    'args': {'spawn_ms': round(r['spawn'] * 1000, 3),
+                             'output_size': r['output_size'],
+                             'exit_code': r['exit_code'],
+                             'error': r['error']},
+                })
+            for name, tid in threads.items():
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': name}})
+            data = {'traceEvents': events, 'displayTimeUnit': 'ms'}
+        
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+
+
+class StaticInfoCache:
+    """按设备缓存不会变化的信息（型号、SN、IMEI、CPU、品牌、版本等）
+
+    缓存以 (boot_id, 启动原因, 系统指纹) 为标识，设备重启或刷机后自动失效。
+    """
+    
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+    
+    def get(self, key, identity):
+        """标识一致时返回 (info_items, device_info) 的副本，否则返回 None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry or entry['identity'] != identity:
+                return None
+            return dict(entry['info_items']), dict(entry['device_info'])
+    
+    def put(self, key, identity, info_items, device_info):
+        with self.lock:
+            self.entries[key] = {
+                'identity': identity,
+                'info_items': dict(info_items),
+                'device_info': dict(device_info),
+            }
+
+
+class ScanExporter:
+    """逐台设备追加写出扫描结果（JSON Lines 或 CSV），每条写完立即刷新，便于下游 tail"""
+    
+    FORMATS = ('jsonl', 'csv')
+    KEY_COLUMNS = ['设备型号', '序列号(SN)', '生产日期', 'IMEI1', 'IMEI2']
+    IMEI_ALIASES = {'IMEI': 'IMEI1'}
+    
+    def __init__(self, path, fmt=None, columns=()):
+        self.path = path
+        self.format = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        if self.format not in self.FORMATS:
+            raise ValueError(f"不支持的导出格式: {self.format}")
+        self.columns = ['scanned_at', 'serial', 'mode', 'elapsed', 'error'] + self.KEY_COLUMNS + list(columns)
+        self.lock = threading.Lock()
+        self.count = 0
+        if path == '-':
+            # 写到标准输出（无界面命令行），供管道下游直接读取
+            new_file = True
+            self.file = sys.stdout
+        else:
+            new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+            # utf-8-sig 让 Excel 正确识别中文表头；追加到已有文件时不再写 BOM
+            encoding = 'utf-8-sig' if self.format == 'csv' and new_file else 'utf-8'
+            self.file = open(path, 'a', encoding=encoding, newline='')
+        if self.format == 'csv':
+            self.writer = csv.DictWriter(self.file, fieldnames=self.columns, extrasaction='ignore')
+            if new_file:
+                self.writer.writeheader()
+                self.file.flush()
+    
+    def record(self, info_items, device_info, serial=None, mode=None, elapsed=None, error=None):
+        """一台设备的扫描结果 → 一条扁平记录"""
+        record = {
+            'scanned_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'serial': serial or '',
+            'mode': mode or '',
+            'elapsed': round(elapsed, 3) if elapsed is not None else None,
+            'error': error,
+        }
+        # 一个 IMEI 都没取到时扫描结果只有一项 "IMEI"，放进 IMEI1 列，CSV 与 JSONL 的内容一致
+        record.update((self.IMEI_ALIASES.get(item, item), data['value']) for item, data in info_items.items())
+        record.update(device_info)
+        return record
+    
+    def write(self, info_items, device_info, serial=None, mode=None, elapsed=None, error=None):
+        record = self.record(info_items, device_info, serial, mode, elapsed, error)
+        with self.lock:
+            if self.format == 'csv':
+                self.writer.writerow(record)
+            else:
+                self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.file.flush()
+            self.count += 1
+    
+    def write_field(self, section, item, data, serial=None, elapsed=None):
+        """流式扫描中的一项（仅 jsonl）：{"event": "field", ...}，整台设备的记录仍由 write 输出"""
+        if self.format != 'jsonl':
+            raise ValueError("逐项输出只支持 jsonl 格式")
+        if section == 'key':
+            value, status = data['value'], data['status']
+        else:
+            value, status = data, '✓' if data else '✗'
+        record = {
+            'event': 'field',
+            'serial': serial or '',
+            'section': section,
+            'item': item,
+            'value': value,
+            'status': status,
+            'elapsed': round(elapsed, 3) if elapsed is not None else None,
+        }
+        with self.lock:
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.file.flush()
+    
+    def close(self):
+        with self.lock:
+            if self.file is sys.stdout:
+                self.file.flush()
+            else:
+                self.file.close()
+
+
+class ScanStore:
+    """扫描历史库（SQLite）：每次扫描追加一条记录，按 SN、IMEI、型号建索引"""
+
+    TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+    KEY_INFO_NAMES = ('设备型号', '序列号(SN)', '生产日期')
+    MISSING_VALUES = ('无法获取', '无法精确推断', '')
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS scans (
+            id INTEGER PRIMARY KEY,
+            scanned_at TEXT NOT NULL,
+            serial TEXT,
+            mode TEXT,
+            model TEXT,
+            sn TEXT,
+            source TEXT UNIQUE,
+            info_items TEXT NOT NULL,
+            device_info TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS scan_imeis (
+            scan_id INTEGER NOT NULL REFERENCES scans(id) ON DELETE CASCADE,
+            slot INTEGER NOT NULL,
+            imei TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_scans_sn ON scans(sn, scanned_at);
+        CREATE INDEX IF NOT EXISTS idx_scans_model ON scans(model, scanned_at);
+        CREATE INDEX IF NOT EXISTS idx_scans_time ON scans(scanned_at);
+        CREATE INDEX IF NOT EXISTS idx_scan_imeis_imei ON scan_imeis(imei);
+        CREATE INDEX IF NOT EXISTS idx_scan_imeis_scan ON scan_imeis(scan_id);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(self.SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def known_value(self, value):
+        return None if value in self.MISSING_VALUES else value
+
+    def add_scan(self, info_items, device_info, serial=None, mode=None, scanned_at=None, source=None):
+        """追加一次扫描，返回记录 id；source 已导入过时返回 None"""
+        scanned_at = scanned_at or datetime.now().strftime(self.TIME_FORMAT)
+        model = self.known_value(info_items.get('设备型号', {}).get('value', ''))
+        sn = self.known_value(info_items.get('序列号(SN)', {}).get('value', ''))
+        imeis = [data['value'] for item, data in info_items.items()
+                 if item.startswith('IMEI') and re.fullmatch(r'\d{14,15}', data['value'])]
+
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO scans (scanned_at, serial, mode, model, sn, source, info_items, device_info) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (scanned_at, serial, mode, model, sn, source,
+                 json.dumps(info_items, ensure_ascii=False), json.dumps(device_info, ensure_ascii=False)))
+            if not cursor.rowcount:
+                return None
+            scan_id = cursor.lastrowid
+            self.conn.executemany("INSERT INTO scan_imeis (scan_id, slot, imei) VALUES (?, ?, ?)",
+                                  [(scan_id, slot, imei) for slot, imei in enumerate(imeis, 1)])
+        return scan_id
+
+    def row_to_scan(self, row):
+        scan = dict(row)
+        scan['info_items'] = json.loads(scan['info_items'])
+        scan['device_info'] = json.loads(scan['device_info'])
+        return scan
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def latest_scan(self, sn):
+        """某个 SN 最近一次的扫描"""
+        rows = self.query("SELECT * FROM scans WHERE sn = ? ORDER BY scanned_at DESC, id DESC LIMIT 1", (sn,))
+        return self.row_to_scan(rows[0]) if rows else None
+
+    def scans_by_imei(self, imei):
+        """含有某个 IMEI 的所有扫描，最新的在前"""
+        rows = self.query("SELECT s.* FROM scans s JOIN scan_imeis i ON i.scan_id = s.id "
+                          "WHERE i.imei = ? ORDER BY s.scanned_at DESC, s.id DESC", (imei,))
+        return [self.row_to_scan(row) for row in rows]
+
+    def devices_by_model(self, model, since=None):
+        """某个型号的设备（每个 SN 取 since 之后最近一次扫描）"""
+        since = since.strftime(self.TIME_FORMAT) if isinstance(since, datetime) else (since or '')
+        rows = self.query(
+            "SELECT * FROM scans WHERE id IN ("
+            "  SELECT MAX(id) FROM scans WHERE model = ? AND scanned_at >= ? "
+            "  GROUP BY COALESCE(sn, serial, id)"
+            ") ORDER BY scanned_at DESC", (model, since))
+        return [self.row_to_scan(row) for row in rows]
+
+    def duplicate_imeis(self):
+        """出现在多个不同 SN 上的 IMEI：返回 [(imei, [sn, ...]), ...]"""
+        rows = self.query(
+            "SELECT i.imei, GROUP_CONCAT(DISTINCT s.sn) AS sns FROM scan_imeis i "
+            "JOIN scans s ON s.id = i.scan_id WHERE s.sn IS NOT NULL "
+            "GROUP BY i.imei HAVING COUNT(DISTINCT s.sn) > 1 ORDER BY i.imei")
+        return [(row['imei'], row['sns'].split(',')) for row in rows]
+
+    def import_report(self, path):
+        """导入 save_scan_results / save_fleet_report 写出的 txt 报告，返回新导入的扫描数"""
+        with open(path, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+
+        source = os.path.abspath(path)
+        scanned_at, mode = None, None
+        scans = []
+        current = None
+        section = None
+        for line in lines:
+            line = line.strip()
+            if line.startswith('扫描时间: '):
+                scanned_at = line.split(': ', 1)[1]
+            elif line.startswith('扫描模式: '):
+                mode = 'adb' if 'ADB' in line else 'local'
+            elif line.startswith('【设备 ') and line.endswith('】'):
+                current = {'serial': line[4:-1], 'info_items': {}, 'device_info': {}}
+                scans.append(current)
+                section = None
+            elif line in ('【关键信息】', '【系统信息】'):
+                if current is None:
+                    current = {'serial': None, 'info_items': {}, 'device_info': {}}
+                    scans.append(current)
+                section = line
+            elif line.startswith('说明：'):
+                break
+            elif current is not None and ': ' in line:
+                key, value = line.split(': ', 1)
+                if key in ('扫描出错', '扫描耗时'):
+                    continue
+                is_key_info = key in self.KEY_INFO_NAMES or key.startswith('IMEI')
+                if section == '【关键信息】' or (section is None and is_key_info):
+                    current['info_items'][key] = {'value': value,
+                                                  'status': '✗' if value in self.MISSING_VALUES else '✓'}
+                else:
+                    current['device_info'][key] = value
+
+        imported = 0
+        for index, scan in enumerate(scans):
+            if self.add_scan(scan['info_items'], scan['device_info'], serial=scan['serial'], mode=mode,
+                             scanned_at=scanned_at, source=f"{source}#{index}") is not None:
+                imported += 1
+        return imported
+
+    def import_reports(self, paths):
+        """导入多个报告文件或目录（目录下的 device_scan_*.txt 和 fleet_scan_*.txt）"""
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                    if re.fullmatch(r'(device|fleet)_scan_\d{8}_\d{6}\.txt', name)))
+            else:
+                files.append(path)
+        return {path: self.import_report(path) for path in files}
+
+class AdbShellSession:
+    """常驻 adb shell 会话：命令写入 stdin，用唯一结束标记切分每条命令的输出"""
+    
+    def __init__(self, serial=None, timeout=60, client=None):
+        self.serial = serial
+        self.timeout = timeout
+        self.client = client  # 提供时通过 adb server 套接字建立会话，不启动 adb 进程
+        self.process = None
+        self.sock = None
+        self.alive = False
+        self.lines = None
+        self.last_exit_code = None
+        self.lock = threading.Lock()
+    
+    def start(self):
+        """建立会话（套接字或 adb shell 进程）并启动后台读取线程"""
+        if self.client is not None:
+            self.sock = self.client.open_shell_stream(self.serial)
+            stream = self.sock.makefile('rb')
+        else:
+            command = ['adb'] + (['-s', self.serial] if self.serial else []) + ['shell']
+            self.process = subprocess.Popen(
+                command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL
+            )
+            stream = self.process.stdout
+        self.alive = True
+        self.lines = queue.Queue()
+        reader = threading.Thread(target=self._read_output, args=(stream, self.lines), daemon=True)
+        reader.start()
+        # 老设备没有 shell v2 时会分配终端，关闭回显避免命令本身混进输出
+        self._write('stty -echo 2>/dev/null\n')
+    
+    def _read_output(self, stream, lines):
+        """后台线程：逐行转发会话输出，会话结束时放入 None"""
+        try:
+            for line in iter(stream.readline, b''):
+                lines.put(line)
+        except (OSError, ValueError):
+            pass
+        lines.put(None)
+    
+    def _write(self, text):
+        if self.sock is not None:
+            self.sock.sendall(text.encode('utf-8'))
+        else:
+            self.process.stdin.write(text.encode('utf-8'))
+            self.process.stdin.flush()
+    
+    def is_alive(self):
+        if self.process is not None and self.process.poll() is not None:
+            return False
+        return self.alive
+    
+    def close(self):
+        """结束会话"""
+        self.alive = False
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except:
+                pass
+            self.sock = None
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+            except:
+                pass
+            if self.process.poll() is None:
+                self.process.kill()
+            self.process = None
+    
+    def _execute(self, command):
+        """发送一条命令并读取到结束标记为止"""
+        sentinel = f"__DM_END_{uuid.uuid4().hex}__"
+        self._write(f'({command}) </dev/null 2>/dev/null; __rc=$?; echo; echo "{sentinel} $__rc"\n')
+        
+        output = []
+        deadline = time.monotonic() + self.timeout
+        while True:
+            line = self.lines.get(timeout=max(deadline - time.monotonic(), 0))
+            if line is None:
+                self.alive = False
+                raise EOFError("adb shell 会话已断开")
+            text = line.decode('utf-8', errors='ignore').rstrip('\r\n')
+            match = re.match(rf'^{sentinel} (\d+)$', text.strip())
+            if match:
+                self.last_exit_code = int(match.group(1))
+                return '\n'.join(output).strip()
+            output.append(text)
+    
+    def run(self, command, stats=None):
+        """执行命令，会话断开时自动重连一次；提供 stats 字典时写入建立会话的耗时和退出码"""
+        with self.lock:
+            for attempt in range(2):
+                if not self.is_alive():
+                    start = time.perf_counter()
+                    self.start()
+                    if stats is not None:
+                        stats['spawn'] = stats.get('spawn', 0) + time.perf_counter() - start
+                try:
+                    output = self._execute(command)
+                    if stats is not None:
+                        stats['exit_code'] = self.last_exit_code
+                    return output
+                except queue.Empty:
+                    # 命令卡住：丢弃该会话，下次调用重新建立
+                    self.close()
+                    return ''
+                except (OSError, EOFError):
+                    self.close()
+                    if attempt == 1:
+                        raise
+
+class DumpsysIndex:
+    """本地 dumpsys 文件的索引：mmap 映射文件，一次找出全部 "DUMP OF SERVICE" 边界，各段按需解码"""
+    
+    HEADER = b'DUMP OF SERVICE '
+    # 新版 dumpsys 按优先级分段输出："DUMP OF SERVICE CRITICAL 服务名:"、"DUMP OF SERVICE HIGH 服务名:"
+    PRIORITIES = (b'CRITICAL', b'HIGH', b'NORMAL')
+    
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.sections = self.build_index()  # {服务名: [(起始偏移, 结束偏移), ...]}
+        self.parsed = {}
+    
+    def build_index(self):
+        """只扫描段落标题，不把整个文件读成字符串"""
+        sections = {}
+        if self.map is None:
+            return sections
+        headers = []
+        pos = self.map.find(self.HEADER)
+        while pos != -1:
+            line_end = self.map.find(b'\n', pos)
+            line_end = len(self.map) if line_end == -1 else line_end
+            words = self.map[pos + len(self.HEADER):line_end].strip().rstrip(b':').split(None, 1)
+            if len(words) == 2 and words[0] in self.PRIORITIES:
+                words = words[1:]
+            name = words[0].decode('utf-8', errors='ignore') if words else ''
+            headers.append((name, pos, line_end + 1))
+            pos = self.map.find(self.HEADER, line_end)
+        for i, (name, _, start) in enumerate(headers):
+            end = headers[i + 1][1] if i + 1 < len(headers) else len(self.map)
+            # 同一服务在不同优先级下各有一段，按出现顺序合并
+            sections.setdefault(name, []).append((start, end))
+        return sections
+    
+    def section(self, name):
+        """某个服务的输出（首次访问时才解码该段），文件中没有时返回 None"""
+        if name not in self.sections:
+            return None
+        if name not in self.parsed:
+            text = '\n'.join(self.map[start:end].decode('utf-8', errors='ignore')
+                             for start, end in self.sections[name])
+            # 去掉 dumpsys 在段落之间插入的分隔线和耗时说明
+            lines = [line for line in text.splitlines() if not line.startswith('--------')]
+            self.parsed[name] = '\n'.join(lines).strip()
+        return self.parsed[name]
+    
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+
+class SnDateDecoder:
+    """查表式 SN 生产日期解析：第 8 位为月份（1-9），第 9-10 位为日期，超出当月天数时取当月最后一天
+    
+    decode 解析单个 SN；decode_column 批量解析一列 SN（有 NumPy 时向量化），decode_csv 流式处理 CSV。
+    """
+    
+    YEAR = 2025  # 目前的编码规则统一按 2025 年
+    DEFAULT_MONTH, DEFAULT_DAY = 6, 15  # 无法解析时的推算值
+    MIN_LENGTH = 17
+    MONTH_POS, DAY_POS = 7, 8
+    DAYS_IN_MONTH = [0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+    
+    # 字符编码 → 数字（非数字为 -1）
+    DIGITS = [code - ord('0') if ord('0') <= code <= ord('9') else -1 for code in range(256)]
+    # 字符编码 → 月份（只有 '1'..'9' 有效，其余为 0）
+    MONTHS = [digit if digit >= 1 else 0 for digit in DIGITS]
+    # [月份][两位日期] → 实际日期（0 表示不合法；超过当月天数的取当月最后一天）
+    DAYS = [[min(day, last) if month and 1 <= day <= 31 else 0 for day in range(100)]
+            for month, last in enumerate(DAYS_IN_MONTH)]
+    
+    def decode(self, sn):
+        """返回 (年, 月, 日, 是否由 SN 解析得到)"""
+        if sn and len(sn) >= self.MIN_LENGTH:
+            codes = sn[self.MONTH_POS:self.DAY_POS + 2].encode('ascii', errors='replace')
+            month = self.MONTHS[codes[0]]
+            tens, ones = self.DIGITS[codes[1]], self.DIGITS[codes[2]]
+            if month and tens >= 0 and ones >= 0:
+                day = self.DAYS[month][tens * 10 + ones]
+                if day:
+                    return self.YEAR, month, day, True
+        return self.YEAR, self.DEFAULT_MONTH, self.DEFAULT_DAY, False
+    
+    def format(self, year, month, day):
+        return f"{year}年{month}月{day}日"
+    
+    def decode_column(self, sns):
+        """批量解析一列 SN，返回 (年, 月, 日, 是否解析) 四列；有 NumPy 时为数组，否则为列表"""
+        if np is None:
+            columns = list(zip(*(self.decode(sn) for sn in sns))) or [(), (), (), ()]
+            return tuple(list(column) for column in columns)
+        
+        # 非 ASCII 字符替换成 '?'，保证一个字符对应一个字节
+        encoded = np.array([sn.encode('ascii', errors='replace') for sn in sns], dtype=bytes)
+        if encoded.size == 0:
+            empty = np.zeros(0, dtype=np.int32)
+            return empty, empty, empty, np.zeros(0, dtype=bool)
+        width = max(encoded.dtype.itemsize, self.DAY_POS + 2)
+        # 每个 SN 一行、每个字符一列的字节矩阵，定长补 0
+        matrix = encoded.astype(f'S{width}').view(np.uint8).reshape(len(encoded), width)
+        
+        digits = np.asarray(self.DIGITS, dtype=np.int16)
+        months = np.asarray(self.MONTHS, dtype=np.int16)[matrix[:, self.MONTH_POS]]
+        tens = digits[matrix[:, self.DAY_POS]]
+        ones = digits[matrix[:, self.DAY_POS + 1]]
+        day_codes = np.where((tens >= 0) & (ones >= 0), tens * 10 + ones, 0)
+        days = np.asarray(self.DAYS, dtype=np.int16)[months, day_codes]
+        
+        parsed = (np.char.str_len(encoded) >= self.MIN_LENGTH) & (months > 0) & (days > 0)
+        years = np.full(len(encoded), self.YEAR, dtype=np.int32)
+        return (years, np.where(parsed, months, self.DEFAULT_MONTH).astype(np.int32),
+                np.where(parsed, days, self.DEFAULT_DAY).astype(np.int32), parsed)
+    
+    def decode_csv(self, source, target, column='sn', chunk_size=65536):
+        """流式解析 CSV：逐块读取、解析、写出，内存占用与文件大小无关；返回处理的行数
+        
+        source/target 为已打开的文本文件；输出为原有各列加上 生产年份、生产月份、生产日、生产日期、推断方式。
+        """
+        reader = csv.reader(source)
+        writer = csv.writer(target)
+        header = next(reader, None)
+        if header is None:
+            return 0
+        if column not in header:
+            raise ValueError(f"CSV 中没有列: {column}")
+        index = header.index(column)
+        writer.writerow(header + ['生产年份', '生产月份', '生产日', '生产日期', '推断方式'])
+        
+        total = 0
+        while True:
+            rows = [row for _, row in zip(range(chunk_size), reader)]
+            if not rows:
+                return total
+            # 列数不足的行补齐，保证新增的列对齐表头
+            rows = [row + [''] * (len(header) - len(row)) for row in rows]
+            sns = [row[index].strip() for row in rows]
+            years, months, days, parsed = self.decode_column(sns)
+            for row, year, month, day, ok in zip(rows, years, months, days, parsed):
+                year, month, day = int(year), int(month), int(day)
+                writer.writerow(row + [year, month, day, self.format(year, month, day),
+                                       '解析' if ok else '推算'])
+            total += len(rows)
+
+
+class CaptureArchive:
+    """设备命令录制档案（gzip 压缩的 JSON Lines）：首行为文件头，之后每行一条 {command, output}
+    
+    录制时把一台设备一次扫描中的全部设备端命令及原始输出写入一个 .jsonl.gz 文件；
+    回放时按命令原文查找输出，同一命令出现多次时按录制顺序依次返回。
+    """
+    
+    FORMAT = 'dm-capture'
+    VERSION = 1
+    SUFFIX = '.jsonl.gz'
+    
+    def __init__(self, serial=None, header=None):
+        self.serial = serial
+        self.header = header or {}
+        self.entries = []
+        self.replies = {}  # 回放：{命令: [输出, ...]}
+        self.served = {}  # 回放：{命令: 已返回次数}
+        self.misses = []  # 回放：档案中没有的命令
+        self.lock = threading.Lock()
+    
+    def record(self, command, output, elapsed=None):
+        with self.lock:
+            self.entries.append({'command': command, 'output': output,
+                                 'elapsed': round(elapsed, 6) if elapsed is not None else None})
+    
+    def save(self, directory, serial=None):
+        """写出档案文件，返回文件路径"""
+        serial = serial or self.serial or 'device'
+        os.makedirs(directory, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        path = os.path.join(directory, f"capture_{re.sub(r'[^A-Za-z0-9._-]', '_', serial)}_{timestamp}{self.SUFFIX}")
+        header = dict(self.header, format=self.FORMAT, version=self.VERSION, serial=serial,
+                      recorded_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        with self.lock, gzip.open(path, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps(header, ensure_ascii=False) + '\n')
+            for entry in self.entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        return path
+    
+    @classmethod
+    def load(cls, path):
+        """读取档案文件用于回放"""
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            if header.get('format') != cls.FORMAT:
+                raise ValueError(f"不是录制档案: {path}")
+            archive = cls(header.get('serial'), header)
+            for line in f:
+                entry = json.loads(line)
+                archive.entries.append(entry)
+                archive.replies.setdefault(entry['command'], []).append(entry['output'])
+        return archive
+    
+    @classmethod
+    def find(cls, paths):
+        """展开文件和目录，返回全部档案文件路径"""
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                    if name.endswith(cls.SUFFIX)))
+            else:
+                files.append(path)
+        return files
+    
+    def reply(self, command):
+        """回放一条命令的输出；档案中没有时记为未命中并返回空字符串"""
+        with self.lock:
+            outputs = self.replies.get(command)
+            if not outputs:
+                self.misses.append(command)
+                return ''
+            index = self.served.get(command, 0)
+            self.served[command] = index + 1
+            return outputs[min(index, len(outputs) - 1)]
+
+
+class FleetStager:
+    """批量把设备送进 Fastboot：每台设备按 normal → rebooting → fastboot → ready 推进
+    
+    最多同时重启 max_parallel 台，每台从发出重启起有独立的时限；一个后台线程统一轮询
+    fastboot devices，所有等待中的设备共用它的结果。到 ready（getvar 确认可通信）为止，
+    不执行任何解锁、擦除之类的操作。
+    """
+    
+    STATES = ('normal', 'rebooting', 'fastboot', 'ready', 'failed', 'timeout')
+    STATE_NAMES = {'normal': '正常开机', 'rebooting': '重启中', 'fastboot': 'Fastboot',
+                   'ready': '就绪', 'failed': '失败', 'timeout': '超时'}
+    POLL_INTERVAL = 0.5  # fastboot devices 轮询间隔秒数
+    
+    def __init__(self, manager, serials, max_parallel=None, deadline=None, on_change=None):
+        self.manager = manager
+        self.serials = list(serials)
+        self.max_parallel = max_parallel or manager.FLEET_MAX_WORKERS
+        self.deadline = deadline or manager.fastboot_timeout
+        self.on_change = on_change
+        self.states = {serial: 'normal' for serial in self.serials}
+        self.details = {serial: {} for serial in self.serials}
+        self.fastboot_serials = set()
+        self.condition = threading.Condition()
+        self.stopped = threading.Event()
+    
+    def set_state(self, serial, state, **details):
+        # 回调也在锁内执行：各线程的进度行不会交错，汇总与状态变化一一对应
+        with self.condition:
+            self.states[serial] = state
+            self.details[serial].update(details)
+            if self.on_change:
+                self.on_change(serial, state, self.summary())
+    
+    def summary(self):
+        """各状态的设备数 {状态: 数量}"""
+        with self.condition:
+            counts = dict.fromkeys(self.STATES, 0)
+            for state in self.states.values():
+                counts[state] += 1
+            return counts
+    
+    def poll_once(self):
+        """执行一次 fastboot devices，更新 fastboot_serials 并唤醒等待中的设备"""
+        try:
+            serials = {serial for serial, _ in self.manager.run_fastboot_devices(self.manager.DETECT_TIMEOUT)}
+        except (OSError, subprocess.SubprocessError):
+            return
+        with self.condition:
+            self.fastboot_serials = serials
+            self.condition.notify_all()
+    
+    def poll_fastboot(self):
+        """后台线程：轮询 fastboot devices"""
+        while not self.stopped.wait(self.POLL_INTERVAL):
+            self.poll_once()
+    
+    def wait_for_fastboot(self, serial, deadline):
+        with self.condition:
+            while serial not in self.fastboot_serials:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return True
+    
+    def stage(self, serial):
+        """单台设备的状态机"""
+        start = time.monotonic()
+        with self.condition:
+            already = serial in self.fastboot_serials
+        if not already:
+            if not self.manager.reboot_to_bootloader(serial):
+                self.set_state(serial, 'failed', error="adb reboot bootloader 失败")
+                return
+            self.set_state(serial, 'rebooting')
+            if not self.wait_for_fastboot(serial, start + self.deadline):
+                self.set_state(serial, 'timeout', elapsed=time.monotonic() - start)
+                return
+        self.set_state(serial, 'fastboot')
+        
+        # 用 getvar all 确认 bootloader 能正常通信，顺便取回解锁状态，供逐台确认时显示
+        result = self.manager.scan_fastboot_device(serial)
+        if result['error']:
+            self.set_state(serial, 'failed', error=result['error'], elapsed=time.monotonic() - start)
+        else:
+            self.set_state(serial, 'ready', info_items=result['info_items'], elapsed=time.monotonic() - start)
+    
+    def run(self):
+        """并发推进全部设备，结束后返回 {序列号: 状态}"""
+        # 先同步轮询一次：已在 Fastboot 的设备不能再发 adb reboot bootloader
+        self.poll_once()
+        poller = threading.Thread(target=self.poll_fastboot, daemon=True)
+        poller.start()
+        try:
+            with ThreadPoolExecutor(max_workers=max(min(self.max_parallel, len(self.serials)), 1)) as pool:
+                for future in [pool.submit(self.stage, serial) for serial in self.serials]:
+                    future.result()
+        finally:
+            self.stopped.set()
+        with self.condition:
+            return dict(self.states)
+
+
+# dumpsys battery 中 health 的取值（BatteryManager.BATTERY_HEALTH_*）
+BATTERY_HEALTH = {'1': '未知', '2': '良好', '3': '过热', '4': '损坏', '5': '过压', '6': '故障', '7': '过冷'}
+
+def battery_temperature(output):
+    """dumpsys battery 的 temperature 行或 /sys 的 temp 文件（单位 0.1°C）"""
+    match = re.search(r'^\s*(?:temperature:\s*)?(-?\d+)\s*$', output, re.MULTILINE)
+    return f"{int(match.group(1)) / 10:.1f}°C" if match else ''
+
+def battery_health(output):
+    """dumpsys battery 的 health 行"""
+    match = re.search(r'^\s*health:\s*(\d+)', output, re.MULTILINE)
+    return BATTERY_HEALTH.get(match.group(1), '') if match else ''
+
+class DeviceManager:
+    FLEET_MAX_WORKERS = 8  # 多设备扫描时同时工作的设备数上限
+    ASYNC_PROBE_LIMIT = 6  # 异步扫描时单台设备同时运行的探测进程上限
+    DETECT_TIMEOUT = 5  # 设备模式检测中每个探测的超时秒数
+    FASTBOOT_WAIT_TIMEOUT = 60  # 重启后等待设备进入Fastboot的最长秒数
+    BOOT_ID_PATH = '/proc/sys/kernel/random/boot_id'  # 每次开机都会变化
+    BOOT_ID_PROP = 'dm.boot_id'  # boot_id 在属性快照中的键名
+    NATIVE_LOCAL_TOOLS = ('cat', 'uname', 'df')  # 本地模式下可在进程内完成的命令（见 read_local_argv）
+    RETRY_ATTEMPTS = 3  # 设备离线、协议错误等暂时性错误的最多尝试次数
+    RETRY_BASE_DELAY = 0.25  # 重试间隔（秒），每次翻倍
+    BREAKER_THRESHOLD = 5  # 连续失败多少次（含重试）后熔断，跳过该设备其余的探测
+    BREAKER_COOLDOWN = 30  # 熔断后多少秒再试探设备
+    
+    def __init__(self, mode=None, serial=None, no_delay=False, fastboot_timeout=None, tracer=None,
+                 static_cache=None, breakers=None):
+        self.mode = mode
+        self.serial = serial  # 指定设备序列号（多设备时用 adb -s 区分）
+        self.no_delay = no_delay  # 去掉所有纯展示用的等待（脚本化运行）
+        self.fastboot_timeout = fastboot_timeout or self.FASTBOOT_WAIT_TIMEOUT
         self.device_info = {}
+        self.prop_snapshot = None  # 属性快照：一次 getprop 解析出的 {属性名: 值}
+        self.use_shell_session = True  # ADB模式下复用常驻 adb shell 会话
+        self.shell_session = None
+        self.session_lock = threading.Lock()  # 流式扫描中 IMEI 与型号、SN 在不同线程取值，共用一个会话
+        self.adb_client = AdbClient()  # 直连 adb server，不可用时退回调用 adb 程序
+        self.registry = None  # 后台设备登记表（start_device_watcher 启动）
+        self.local_tools = {}  # 本地模式下命令是否存在的缓存
+        self.tracer = tracer or CommandTracer()  # 每条命令的计时记录
+        self.trace_path = None  # 扫描后导出时间线的文件路径
+        self.trace_format = 'chrome'
+        self.scan_store = None  # 扫描历史库（--db 指定时启用）
+        self.exporter = None  # 结构化导出（--export 指定时启用）
+        self.static_cache = static_cache or StaticInfoCache()  # 按设备缓存的静态信息
+        self.use_static_cache = True  # 重复扫描时只重新获取电池、存储等易变信息
+        self.static_cache_hit = False  # 最近一次扫描是否使用了缓存
+        self.source_cache = {}  # 本次扫描已读取的数据源 {数据源标识: 原始输出}
+        self.source_tasks = {}  # 异步扫描中正在读取的数据源 {数据源标识: Task}
+        self.dumpsys_bulk = None  # 批量 dumpsys：None 不启用，[] 完整 dumpsys，否则为服务名列表
+        self.dumpsys_dir = None  # 批量 dumpsys 文件的保存目录（不指定时扫描后删除）
+        self.dumpsys_index = None  # 本次扫描的 dumpsys 文件索引
+        self.capture_dir = None  # 录制目录（--record 指定时每次扫描写一个档案）
+        self.capture = None  # 正在录制的档案
+        self.replay = None  # 回放档案：设置后设备端命令全部由档案应答，不连接设备
+        # 各设备的熔断器 {序列号: CircuitBreaker}，与多设备扫描的 worker 共用，跨多次扫描保留
+        self.breakers = breakers if breakers is not None else {}
+        # 没有指定序列号时无法区分是哪台设备：熔断器只在本次扫描内有效，不放进 breakers
+        self.scan_breaker = CircuitBreaker(self.BREAKER_THRESHOLD, self.BREAKER_COOLDOWN)
+        self.command_errors = []  # 本次扫描中最终失败的设备端命令（DeviceCommandError.as_dict()）
         
     def clear_screen(self):
-        """清屏函数"""
-        os.system('cls' if os.name == 'nt' else 'clear')
+        """清屏函数（非 Windows 直接输出 ANSI 控制符，不再为清屏启动 shell）"""
+        if not sys.stdout.isatty():
+            return
+        if os.name == 'nt':
+            os.system('cls')
+        else:
+            sys.stdout.write('\033[H\033[2J\033[3J')
+            sys.stdout.flush()
+    
+    def pause(self, seconds):
+        """展示用的停顿，--no-delay 时跳过"""
+        if not self.no_delay:
+            time.sleep(seconds)
     
     def print_banner(self):
         """打印标题"""
@@ -51,39 +1373,651 @@ class DeviceManager:
             else:
                 print("无效选择，请重新输入！")
     
+    def get_adb_client(self):
+        """adb server 可直连时返回客户端，否则返回 None"""
+        if self.adb_client is not None and self.adb_client.is_available():
+            return self.adb_client
+        return None
+    
+    def start_device_watcher(self):
+        """启动后台设备监听（adb track-devices + fastboot 低频轮询）"""
+        if self.registry is None:
+            self.registry = DeviceRegistry(self.adb_client, self.run_fastboot_devices).start()
+        return self.registry
+    
+    def stop_device_watcher(self):
+        """停止后台设备监听"""
+        if self.registry is not None:
+            self.registry.stop()
+            self.registry = None
+    
+    def get_shell_session(self):
+        """获取（必要时创建）常驻 adb shell 会话"""
+        with self.session_lock:
+            if self.shell_session is None:
+                self.shell_session = AdbShellSession(self.serial, client=self.get_adb_client())
+            return self.shell_session
+    
+    def close_shell_session(self):
+        """关闭常驻 adb shell 会话"""
+        if self.shell_session is not None:
+            self.shell_session.close()
+            self.shell_session = None
+    
+    def adb_argv(self, *args):
+        """组装 adb 参数列表（指定了设备时带上 -s）"""
+        return ['adb'] + (['-s', self.serial] if self.serial else []) + list(args)
+    
+    @contextlib.contextmanager
+    def traced(self, command, serial=None):
+        """命令计时：执行方在 yield 出的 stats 中填写 backend、spawn、exit_code、output_size"""
+        stats = {}
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            self.tracer.record(command, serial or self.serial, start, time.perf_counter(), stats)
+    
+    def exec_process(self, args, shell=False, errors=None):
+        """启动进程并等待结束，返回 (输出, 退出码, 启动耗时)；提供 errors 列表时把标准错误追加进去"""
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            args,
+            shell=shell,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL if errors is None else subprocess.PIPE
+        )
+        spawn = time.perf_counter() - start
+        stdout, stderr = process.communicate()
+        if errors is not None:
+            errors.append(stderr.decode('utf-8', errors='ignore'))
+        return stdout.decode('utf-8', errors='ignore').strip(), process.returncode, spawn
+    
+    async def exec_process_async(self, args, shell=False, errors=None):
+        """exec_process 的异步版本"""
+        start = time.perf_counter()
+        stderr = asyncio.subprocess.DEVNULL if errors is None else asyncio.subprocess.PIPE
+        if shell:
+            process = await asyncio.create_subprocess_shell(
+                args, stdout=asyncio.subprocess.PIPE, stderr=stderr)
+        else:
+            process = await asyncio.create_subprocess_exec(
+                *args, stdout=asyncio.subprocess.PIPE, stderr=stderr)
+        spawn = time.perf_counter() - start
+        stdout, stderr = await process.communicate()
+        if errors is not None:
+            errors.append(stderr.decode('utf-8', errors='ignore'))
+        return stdout.decode('utf-8', errors='ignore').strip(), process.returncode, spawn
+    
+    def run_device_command(self, command):
+        """在设备端执行命令（回放时由档案应答，录制时记下原始输出）"""
+        if self.replay is not None:
+            with self.traced(command) as stats:
+                output = self.replay.reply(command)
+                stats.update(backend='replay', output_size=len(output))
+                return output
+        start = time.perf_counter()
+        output = self.retry_device_command(lambda: self.execute_device_command(command), command)
+        if self.capture is not None:
+            self.capture.record(command, output, time.perf_counter() - start)
+        return output
+    
+    def device_error(self, message, command, stats=None):
+        """adb 报错文本是设备连接类错误时返回对应的 DeviceCommandError（并记入 stats），否则返回 None"""
+        kind = DeviceCommandError.classify(message)
+        if kind is None:
+            return None
+        if stats is not None:
+            stats['error'] = kind
+        return DeviceCommandError(kind, message.strip(), command)
+    
+    def execute_device_command(self, command):
+        """在设备端执行命令：常驻会话 → 直连 adb server → 单次 adb shell
+        
+        设备离线、未授权、未找到时抛出 DeviceCommandError（换一种方式也不会成功）；协议错误时换下一种方式。
+        """
+        with self.traced(command) as stats:
+            if self.use_shell_session:
+                try:
+                    output = self.get_shell_session().run(command, stats)
+                    stats.update(backend='session', output_size=len(output))
+                    return output
+                except Exception as e:
+                    # 会话无法建立时退回单次 adb shell
+                    self.close_shell_session()
+                    error = self.device_error(str(e), command, stats)
+                    if error and error.kind != 'protocol':
+                        raise error
+            client = self.get_adb_client()
+            if client is not None:
+                try:
+                    output, exit_code = client.shell(self.serial, command, stats)
+                    stats.update(backend='socket', exit_code=exit_code, output_size=len(output))
+                    return output.strip()
+                except AdbProtocolError as e:
+                    error = self.device_error(str(e), command, stats)
+                    if error and error.kind != 'protocol':
+                        raise error
+                except OSError:
+                    pass
+            # 命令整体交给设备端 shell，本机不再经过 shell
+            errors = []
+            output, exit_code, spawn = self.exec_process(self.adb_argv('shell', command), errors=errors)
+            stats.update(backend='process', spawn=spawn, exit_code=exit_code, output_size=len(output))
+            error = self.device_error(errors[0], command, stats) if exit_code else None
+            if error:
+                raise error
+            return output
+    
+    def retry_device_command(self, execute, command):
+        """执行设备端命令并处理失败：暂时性错误按指数退避重试，每次失败都计入熔断器；熔断后直接失败"""
+        breaker = self.device_breaker()
+        for attempt in range(1, self.RETRY_ATTEMPTS + 1):
+            if not breaker.allow():
+                raise DeviceCommandError('circuit_open', str(breaker.last_error), command)
+            try:
+                output = execute()
+            except DeviceCommandError as e:
+                e.attempts = attempt
+                breaker.record_failure(e)
+                if e.transient and attempt < self.RETRY_ATTEMPTS:
+                    time.sleep(self.RETRY_BASE_DELAY * 2 ** (attempt - 1))
+                    continue
+                self.command_errors.append(e.as_dict())
+                raise
+            breaker.record_success()
+            return output
+    
+    async def retry_device_command_async(self, execute, command):
+        """retry_device_command 的异步版本（execute 返回协程）"""
+        breaker = self.device_breaker()
+        for attempt in range(1, self.RETRY_ATTEMPTS + 1):
+            if not breaker.allow():
+                raise DeviceCommandError('circuit_open', str(breaker.last_error), command)
+            try:
+                output = await execute()
+            except DeviceCommandError as e:
+                e.attempts = attempt
+                breaker.record_failure(e)
+                if e.transient and attempt < self.RETRY_ATTEMPTS:
+                    await asyncio.sleep(self.RETRY_BASE_DELAY * 2 ** (attempt - 1))
+                    continue
+                self.command_errors.append(e.as_dict())
+                raise
+            breaker.record_success()
+            return output
+    
+    def device_breaker(self):
+        """当前设备的熔断器（指定了序列号时按序列号保存，不存在时创建）"""
+        if not self.serial:
+            return self.scan_breaker
+        breaker = self.breakers.get(self.serial)
+        if breaker is None:
+            breaker = self.breakers.setdefault(self.serial, CircuitBreaker(self.BREAKER_THRESHOLD, self.BREAKER_COOLDOWN))
+        return breaker
+    
+    def refresh_breaker(self):
+        """扫描开始时调用：设备已重新处于 device 状态（重新插线、已点允许）时立即恢复熔断器"""
+        if not self.serial:
+            self.scan_breaker = CircuitBreaker(self.BREAKER_THRESHOLD, self.BREAKER_COOLDOWN)
+            return
+        breaker = self.device_breaker()
+        if breaker.is_open and (self.serial, 'device') in (self.list_adb_devices() or []):
+            breaker.record_success()
+    
+    def scan_error(self):
+        """熔断时返回扫描的错误说明（其余探测已跳过），否则返回 None"""
+        breaker = self.device_breaker()
+        if not breaker.is_open:
+            return None
+        error = breaker.last_error
+        return f"{DeviceCommandError.LABELS.get(error.kind, error.kind)}，已跳过其余探测: {error.message}"
+    
     def run_command(self, command):
         """运行命令并返回结果"""
         try:
             if self.mode == 'adb':
                 # 如果是ADB模式，在所有命令前添加 adb shell
                 if not command.startswith('adb'):
-                    command = f'adb shell {command}'
+                    return self.run_device_command(command)
+                command = self.with_serial(command)
+            elif self.mode == 'local' and not self.local_tool_available(command):
+                return ''
             
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                encoding='utf-8',
-                errors='ignore'
-            )
-            return result.stdout.strip()
+            with self.traced(command) as stats:
+                output, exit_code, spawn = self.exec_process(command, shell=True)
+                stats.update(backend='process', spawn=spawn, exit_code=exit_code, output_size=len(output))
+                return output
         except Exception as e:
             return f"命令执行错误: {str(e)}"
     
+    def with_serial(self, command):
+        """指定了设备时给 adb 命令带上 -s"""
+        if self.serial and command.startswith('adb'):
+            return f'adb -s {self.serial}' + command[len('adb'):]
+        return command
+    
+    async def run_command_async(self, command):
+        """异步运行命令（asyncio 子进程）并返回结果"""
+        try:
+            if self.mode == 'local' and not self.local_tool_available(command):
+                return ''
+            if self.mode == 'adb' and not command.startswith('adb'):
+                return await self.run_device_command_async(command)
+            with self.traced(command) as stats:
+                output, exit_code, spawn = await self.exec_process_async(
+                    self.with_serial(command) if self.mode == 'adb' else command, shell=True)
+                stats.update(backend='process', spawn=spawn, exit_code=exit_code, output_size=len(output))
+                return output
+        except Exception as e:
+            return f"命令执行错误: {str(e)}"
+    
+    async def run_device_command_async(self, command):
+        """run_device_command 的异步版本"""
+        if self.replay is not None:
+            return self.run_device_command(command)
+        start = time.perf_counter()
+        output = await self.retry_device_command_async(lambda: self.execute_device_command_async(command), command)
+        if self.capture is not None:
+            self.capture.record(command, output, time.perf_counter() - start)
+        return output
+    
+    async def execute_device_command_async(self, command):
+        """execute_device_command 的异步版本：直连 adb server → 单次 adb 进程"""
+        with self.traced(command) as stats:
+            client = self.get_adb_client()
+            if client is not None:
+                # 直连 adb server：每条命令一个套接字，不启动任何进程
+                try:
+                    output, exit_code = await asyncio.to_thread(client.shell, self.serial, command, stats)
+                    stats.update(backend='socket', exit_code=exit_code, output_size=len(output))
+                    return output.strip()
+                except AdbProtocolError as e:
+                    error = self.device_error(str(e), command, stats)
+                    if error and error.kind != 'protocol':
+                        raise error
+                except OSError:
+                    pass
+            # 设备端命令直接 exec adb，不经过本机 shell
+            errors = []
+            output, exit_code, spawn = await self.exec_process_async(self.adb_argv('shell', command), errors=errors)
+            stats.update(backend='process', spawn=spawn, exit_code=exit_code, output_size=len(output))
+            error = self.device_error(errors[0], command, stats) if exit_code else None
+            if error:
+                raise error
+            return output
+    
+    def load_prop_snapshot(self):
+        """一次性读取全部属性（每次扫描只执行一次 getprop），boot_id 随同一次往返读取"""
+        if self.mode == 'adb':
+            output = self.run_command(f'getprop; echo "[{self.BOOT_ID_PROP}]: [$(cat {self.BOOT_ID_PATH})]"')
+        else:
+            output = self.run_command('getprop')
+        snapshot = {}
+        for line in output.split('\n'):
+            match = re.match(r'^\[(.+?)\]: \[(.*)\]$', line.strip())
+            if match:
+                snapshot[match.group(1)] = match.group(2).strip()
+        if self.mode != 'adb':
+            snapshot[self.BOOT_ID_PROP] = self.read_text(self.BOOT_ID_PATH)
+        self.prop_snapshot = snapshot
+        # 新的一次扫描：数据源缓存清空
+        self.source_cache = {}
+        self.source_tasks = {}
+        return snapshot
+    
+    def device_identity(self):
+        """静态信息缓存的键和标识：(序列号, (boot_id, 启动原因, 系统指纹))，无法识别时返回 (None, None)"""
+        snapshot = self.prop_snapshot or {}
+        key = self.serial or snapshot.get('ro.serialno') or (self.mode == 'local' and 'local') or None
+        identity = (snapshot.get(self.BOOT_ID_PROP, ''),
+                    snapshot.get('ro.boot.bootreason', ''),
+                    snapshot.get('ro.build.fingerprint', ''))
+        if not key or not (identity[0] or identity[2]):
+            return None, None
+        return key, identity
+    
+    def get_prop(self, name):
+        """从属性快照读取属性，快照中没有时才单独执行 getprop"""
+        if self.prop_snapshot is None:
+            self.load_prop_snapshot()
+        if name not in self.prop_snapshot:
+            value = self.run_command(f'getprop {name}')
+            # 命令失败（设备离线、熔断等）按没有这个属性处理，错误文本不能当成属性值
+            self.prop_snapshot[name] = '' if '命令执行错误' in value else value
+        return self.prop_snapshot[name]
+    
+    def local_tool_available(self, command):
+        """本地模式下命令的程序是否存在（不存在时不必启动 shell）"""
+        tool = command.split()[0] if command.split() else ''
+        if tool not in self.local_tools:
+            available = shutil.which(tool) is not None
+            # getprop/dumpsys/service 只在 Android 上有意义（普通 Linux 的 service 是别的程序）
+            if tool in ('getprop', 'dumpsys', 'service'):
+                available = available and os.path.isdir('/system/bin')
+            self.local_tools[tool] = available
+        return self.local_tools[tool]
+    
+    def read_text(self, path):
+        """读取文本文件，失败返回空字符串"""
+        try:
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                return f.read().strip()
+        except OSError:
+            return ''
+    
+    def format_size(self, size):
+        """按 df -h 的格式显示容量"""
+        for unit in ['', 'K', 'M', 'G', 'T']:
+            if size < 1024 or unit == 'T':
+                break
+            size /= 1024
+        if unit and size < 10:
+            return f"{size:.1f}{unit}"
+        return f"{size:.0f}{unit}"
+    
+    def read_disk_usage(self, path):
+        """用 os.statvfs 生成与 df -h 最后一行相同格式的结果"""
+        stat = os.statvfs(path)
+        total = stat.f_blocks * stat.f_frsize
+        used = (stat.f_blocks - stat.f_bfree) * stat.f_frsize
+        avail = stat.f_bavail * stat.f_frsize
+        percent = -(-used * 100 // (used + avail)) if used + avail else 0
+        
+        source = path
+        for line in self.read_text('/proc/mounts').split('\n'):
+            parts = line.split()
+            if len(parts) >= 2 and parts[1] == path:
+                source = parts[0]
+        return (f"{source} {self.format_size(total)} {self.format_size(used)} "
+                f"{self.format_size(avail)} {percent}% {path}")
+    
+    def read_local_argv(self, argv):
+        """本地模式下在进程内完成 cat/uname/df（直接读 /proc、/sys），无法原生处理时返回 None"""
+        if self.mode != 'local' or not hasattr(os, 'uname'):
+            return None
+        try:
+            if len(argv) == 2 and argv[0] == 'cat':
+                return self.read_text(argv[1])
+            if argv == ['uname', '-m']:
+                return os.uname().machine
+            if argv == ['uname', '-r']:
+                return os.uname().release
+            if len(argv) == 3 and argv[:2] == ['df', '-h']:
+                return self.read_disk_usage(argv[2])
+        except OSError:
+            return ''
+        return None
+    
+    def run_argv(self, argv):
+        """本地直接 exec 程序（不经过 shell）并返回输出"""
+        if not self.local_tool_available(argv[0]):
+            return ''
+        with self.traced(' '.join(argv)) as stats:
+            output, exit_code, spawn = self.exec_process(argv)
+            stats.update(backend='process', spawn=spawn, exit_code=exit_code, output_size=len(output))
+            return output
+    
+    def probe_command(self, probe):
+        """结构化探测对应的命令行（参数逐个转义，供设备端执行）"""
+        return ' '.join(shlex.quote(arg) for arg in probe['argv'])
+    
+    def extract_probe(self, probe, output):
+        """用探测的 extract（正则或函数）在进程内解析输出"""
+        extract = probe.get('extract')
+        value = ''
+        if output:
+            if extract is None:
+                value = output.strip()
+            elif callable(extract):
+                value = (extract(output) or '').strip()
+            else:
+                match = re.search(extract, output, re.MULTILINE)
+                if match:
+                    value = (match.group(1) if match.groups() else match.group(0)).strip()
+        return value or probe.get('default', '')
+    
+    def fetch_argv(self, argv):
+        """读取结构化探测的原始输出：批量 dumpsys 文件 → 本地进程内读取 → 设备端执行 → 本地 exec"""
+        section = self.dumpsys_section(argv)
+        if section is not None:
+            return section
+        try:
+            output = self.read_local_argv(argv)
+            if output is None:
+                if self.mode == 'adb':
+                    output = self.run_device_command(self.probe_command({'argv': argv}))
+                else:
+                    output = self.run_argv(argv)
+        except Exception:
+            output = ''
+        return output
+    
+    async def run_probe_async(self, probe):
+        """执行结构化探测 {'argv': [...], 'extract': 正则或函数, 'default': 缺省值}
+        
+        同一次扫描中读取同一数据源的探测共用一次读取。
+        """
+        key = self.source_key(probe)
+        if key in self.source_cache:
+            return self.extract_probe(probe, self.source_cache[key])
+        if key not in self.source_tasks:
+            self.source_tasks[key] = asyncio.ensure_future(self.fetch_argv_async(probe['argv']))
+        output = await self.source_tasks[key]
+        self.source_cache[key] = output
+        return self.extract_probe(probe, output)
+    
+    async def fetch_argv_async(self, argv):
+        """fetch_argv 的异步版本"""
+        section = self.dumpsys_section(argv)
+        if section is not None:
+            return section
+        probe = {'argv': argv}
+        output = self.read_local_argv(probe['argv'])
+        if output is None:
+            if self.mode == 'adb':
+                output = await self.run_command_async(self.probe_command(probe))
+            elif self.local_tool_available(probe['argv'][0]):
+                try:
+                    with self.traced(' '.join(probe['argv'])) as stats:
+                        output, exit_code, spawn = await self.exec_process_async(probe['argv'])
+                        stats.update(backend='process', spawn=spawn, exit_code=exit_code, output_size=len(output))
+                except OSError:
+                    output = ''
+            else:
+                output = ''
+        if '命令执行错误' in output:
+            output = ''
+        return output
+    
+    def dumpsys_section(self, argv):
+        """启用批量 dumpsys 时，dumpsys 服务名 的探测直接读本地文件中的对应段落"""
+        if self.dumpsys_index is None or len(argv) != 2 or argv[0] != 'dumpsys':
+            return None
+        section = self.dumpsys_index.section(argv[1])
+        if section is not None and self.capture is not None:
+            # 档案里按单独执行 dumpsys 服务名 保存，回放时不需要批量文件
+            self.capture.record(self.probe_command({'argv': argv}), section)
+        return section
+    
+    def capture_dumpsys(self, path, services=None):
+        """把完整 dumpsys（或指定服务列表）的输出流式写入本地文件，返回写入的字节数"""
+        if services:
+            command = '; '.join(f'echo "DUMP OF SERVICE {name}:"; dumpsys {shlex.quote(name)}' for name in services)
+        else:
+            command = 'dumpsys'
+        with self.traced(f'dumpsys > {os.path.basename(path)}') as stats, open(path, 'wb') as f:
+            client = self.get_adb_client()
+            if client is not None:
+                try:
+                    size = client.exec_to_file(self.serial, command, f)
+                    stats.update(backend='socket', output_size=size)
+                    return size
+                except (OSError, AdbProtocolError):
+                    f.seek(0)
+                    f.truncate()
+            start = time.perf_counter()
+            process = subprocess.Popen(self.adb_argv('exec-out', command), stdout=f, stderr=subprocess.DEVNULL)
+            spawn = time.perf_counter() - start
+            exit_code = process.wait()
+            size = f.tell()
+            stats.update(backend='process', spawn=spawn, exit_code=exit_code, output_size=size)
+            return size
+    
+    def open_dumpsys_bulk(self):
+        """扫描开始时抓取一次 dumpsys 并建立索引，返回文件路径
+        
+        抓取失败（adb 不可用、目录不可写等）时删除残留文件并返回 None，本次扫描照常逐个执行 dumpsys 服务名。
+        """
+        path = None
+        try:
+            if self.dumpsys_dir:
+                os.makedirs(self.dumpsys_dir, exist_ok=True)
+                serial = self.serial or (self.prop_snapshot or {}).get('ro.serialno') or 'device'
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                path = os.path.join(self.dumpsys_dir, f"dumpsys_{serial}_{timestamp}.txt")
+            else:
+                fd, path = tempfile.mkstemp(prefix='dumpsys_', suffix='.txt')
+                os.close(fd)
+            self.capture_dumpsys(path, self.dumpsys_bulk)
+            self.dumpsys_index = DumpsysIndex(path)
+            return path
+        except (OSError, AdbProtocolError) as e:
+            log(f"批量 dumpsys 失败，改为逐个获取: {e}")
+            if path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            return None
+    
+    def close_dumpsys_bulk(self, path):
+        if self.dumpsys_index is not None:
+            self.dumpsys_index.close()
+            self.dumpsys_index = None
+        if path and not self.dumpsys_dir:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    def source_key(self, source):
+        """数据源的标识：同一标识的数据源在一次扫描中只读取一次"""
+        if 'prop' in source:
+            return ('prop', source['prop'])
+        if 'argv' in source:
+            return ('argv',) + tuple(source['argv'])
+        return ('command', source['command'])
+    
+    def source_cost(self, source):
+        """数据源的预计代价：属性快照 0，本地进程内读取 0，其余按声明或一次往返计"""
+        if 'prop' in source:
+            return 0
+        if 'argv' in source and self.mode == 'local' and source['argv'][0] in self.NATIVE_LOCAL_TOOLS:
+            return 0
+        return source.get('cost', 1)
+    
+    def read_prop(self, name, live=False):
+        """读取属性：默认只看快照；live=True 时快照里没有的属性单独执行一次 getprop（见 get_prop）"""
+        if self.prop_snapshot and not live:
+            return self.prop_snapshot.get(name, '')
+        return self.get_prop(name)
+    
+    def fetch_source(self, source):
+        """读取数据源的原始输出（同一次扫描内缓存）"""
+        key = self.source_key(source)
+        if key not in self.source_cache:
+            if 'prop' in source:
+                output = self.read_prop(source['prop'])
+            elif 'argv' in source:
+                output = self.fetch_argv(source['argv'])
+            else:
+                output = self.run_command(source['command'])
+                if '命令执行错误' in output:
+                    output = ''
+            self.source_cache[key] = output
+        return self.source_cache[key]
+    
+    def resolve(self, name):
+        """按 KEY_PROBES 的声明解析一个项目：数据源按代价从低到高尝试，第一个通过校验的即返回
+        
+        都不通过时，快照里没有的属性（批量 getprop 中缺失或解析不了的行）再逐个单独 getprop 确认一次。
+        """
+        spec = self.KEY_PROBES[name]
+        sources = sorted(spec['sources'], key=self.source_cost)
+        for source in sources:
+            value = self.accept_value(spec, source, self.fetch_source(source))
+            if value:
+                return value
+        
+        for source in sources:
+            if 'prop' not in source or source['prop'] in (self.prop_snapshot or {}):
+                continue
+            output = self.read_prop(source['prop'], live=True)
+            self.source_cache[self.source_key(source)] = output
+            value = self.accept_value(spec, source, output)
+            if value:
+                return value
+        return None
+    
+    def accept_value(self, spec, source, output):
+        """从数据源输出中取值并清理，通过 spec 的校验时返回该值，否则返回 None"""
+        value = self.extract_probe(source, output)
+        if value and spec.get('clean'):
+            value = spec['clean'](value)
+        if len(value) >= spec.get('min_length', 1) and re.match(spec.get('accept', ''), value):
+            return value
+        return None
+    
+    async def query_async(self, command):
+        """执行探测：结构化探测走 run_probe_async，getprop 类命令走属性快照"""
+        if isinstance(command, dict):
+            return await self.run_probe_async(command)
+        parts = command.split()
+        if len(parts) == 2 and parts[0] == 'getprop':
+            if self.prop_snapshot and parts[1] in self.prop_snapshot:
+                return self.prop_snapshot[parts[1]]
+            # 快照里没有（批量 getprop 中缺失或解析不了的行）：单独执行一次 getprop
+            return await asyncio.to_thread(self.read_prop, parts[1], True)
+        return await self.run_command_async(command)
+    
+    def list_adb_devices(self):
+        """列出 adb 设备 [(序列号, 状态), ...]；adb 无法使用时返回 None"""
+        if self.registry is not None:
+            devices = self.registry.adb_devices()
+            if devices is not None:
+                return devices
+        
+        client = self.get_adb_client()
+        if client is not None:
+            try:
+                return client.devices()
+            except (OSError, AdbProtocolError):
+                pass
+        
+        result = self.run_command('adb devices')
+        if 'List of devices attached' not in result:
+            return None
+        devices = []
+        for line in result.split('\n'):
+            parts = line.split()
+            if len(parts) >= 2 and not line.startswith('List'):
+                devices.append((parts[0], parts[1]))
+        return devices
+    
     def check_adb_connection(self):
         """检查ADB连接（原有功能保持不变）"""
         if self.mode != 'adb':
             return True
             
         print("正在检查ADB连接...")
-        result = self.run_command('adb devices')
+        all_devices = self.list_adb_devices()
         
-        if 'device' not in result or 'List of devices attached' not in result:
+        if all_devices is None:
             print("未检测到ADB设备！")
             return False
         
-        devices = [line for line in result.split('\n') if 'device' in line and not line.startswith('List')]
+        devices = [serial for serial, state in all_devices if state == 'device']
         if len(devices) == 0:
             print("未找到连接的设备！")
             return False
@@ -92,158 +2026,137 @@ class DeviceManager:
         return True
     
     def get_imei_numbers(self):
-        """获取IMEI号码（原有功能保持不变）"""
-        imei_numbers = []
+        """获取IMEI号码（双卡）：属性快照 + 一次批量脚本（dumpsys 与各卡槽的 service call）"""
+        collector = ImeiCollector()
         
+        props = {}
         if self.mode == 'adb':
-            # 方法1：通过getprop获取IMEI
-            for prop in ['gsm.imei', 'ril.imei', 'ro.ril.oem.imei']:
-                result = self.run_command(f'getprop {prop}')
-                if result and len(result) >= 14:
-                    imei_numbers.append(result[:15])
-        
-        # 通用方法
-        imei_commands = [
-            'dumpsys iphonesubinfo | grep "Device ID"',
-            'service call iphonesubinfo 1',
-        ]
+            # 通过getprop获取IMEI：属性快照里没有的就是设备上没有，不再逐个查询
+            if self.prop_snapshot is None:
+                self.load_prop_snapshot()
+            props = self.prop_snapshot
         
-        for cmd in imei_commands:
-            result = self.run_command(cmd)
-            if result:
-                imei_match = re.search(r'(\d{15})', result)
-                if imei_match:
-                    imei = imei_match.group(1)
-                    if imei not in imei_numbers:
-                        imei_numbers.append(imei)
-            
-            if len(imei_numbers) >= 2:
-                break
+        # 通用方法：所有来源一次往返
+        output = ''
+        if self.mode == 'adb' or self.local_tool_available('service'):
+            output = self.run_command(collector.build_script())
         
-        return imei_numbers[:2]
+        return collector.collect(props, output)[:2]
+    
+    # 关键信息的探测声明：sources 为候选数据源（prop 属性 / argv 结构化探测 / command 命令），
+    # 可带 extract 与 cost；clean 清理取到的值，min_length 与 accept 为通过条件
+    KEY_PROBES = {
+        '序列号(SN)': {
+            'sources': [
+                {'prop': 'ro.serialno'},
+                {'prop': 'sys.serialnumber'},
+                {'argv': ['cat', '/proc/cmdline'], 'extract': r'serialno=(\S+)'},
+            ],
+            'clean': lambda value: value.split()[-1].split('=')[-1].strip(),
+            'min_length': 6,
+            'accept': r'^[A-Za-z0-9]{6,}$',
+        },
+        '设备型号': {
+            'sources': [
+                {'prop': 'ro.product.model'},
+                {'prop': 'ro.product.device'},
+                {'prop': 'ro.product.name'},
+                {'prop': 'ro.build.product'},
+            ],
+            'min_length': 3,
+        },
+        '构建日期': {
+            'sources': [
+                {'prop': 'ro.build.date'},
+                {'prop': 'ro.build.date.utc'},
+                {'prop': 'ro.system.build.date'},
+            ],
+            'min_length': 6,
+        },
+    }
     
     def get_serial_number(self):
         """获取序列号（原有功能保持不变）"""
-        sn_commands = [
-            'getprop ro.serialno',
-            'getprop sys.serialnumber',
-            'cat /proc/cmdline | grep -o "serialno=[^ ]*" | cut -d= -f2',
-        ]
-        
-        for cmd in sn_commands:
-            result = self.run_command(cmd)
-            if result and len(result) > 5:
-                clean_sn = result.split()[-1] if ' ' in result else result
-                clean_sn = clean_sn.split('=')[-1] if '=' in clean_sn else clean_sn
-                clean_sn = clean_sn.strip()
-                
-                if re.match(r'^[A-Za-z0-9]{6,}$', clean_sn):
-                    return clean_sn
-        
-        return "无法获取"
+        return self.resolve('序列号(SN)') or "无法获取"
     
     def get_device_model(self):
         """获取设备型号（原有功能保持不变）"""
-        model_commands = [
-            'getprop ro.product.model',
-            'getprop ro.product.device',
-            'getprop ro.product.name',
-            'getprop ro.build.product',
-        ]
-        
-        for cmd in model_commands:
-            result = self.run_command(cmd)
-            if result and len(result) > 2:
-                return result.strip()
-        
-        return "无法获取"
+        return self.resolve('设备型号') or "无法获取"
     
     def get_build_date(self):
         """获取构建日期（新增辅助函数）"""
-        build_cmds = [
-            'getprop ro.build.date',
-            'getprop ro.build.date.utc',
-            'getprop ro.system.build.date',
-        ]
-        
-        for cmd in build_cmds:
-            result = self.run_command(cmd)
-            if result and len(result) > 5:
-                return result.strip()
-        
-        return None
+        return self.resolve('构建日期')
     
-    def estimate_manufacture_date_precise(self, sn, model, imei):
+    def estimate_manufacture_date_precise(self, sn, model, imei, verbose=True):
         """精确推断生产日期到月日（确保2025年）"""
-        print("\n正在精确推断生产日期...")
-        print("═" * 40)
+        log = print if verbose else (lambda *args: None)
+        log("\n正在精确推断生产日期...")
+        log("═" * 40)
         
-        # 根据你之前正确的结果，固定为2025年
-        year = 2025
-        
-        if sn and sn != "无法获取" and len(sn) >= 17:
-            print(f"分析SN码: {sn}")
-            
-            # 你的SN码: JQYNW19815004410
-            # 第7位是'8'，但根据你的结果应该是2025年
-            # 假设编码规则：'8' = 2025年
-            
-            # 提取月份和日期信息
-            # 第8位可能是月份
-            if len(sn) > 7:
-                month_code = sn[7]  # 第8位
-                if month_code.isdigit():
-                    month = int(month_code)
-                    if 1 <= month <= 12:
-                        # 第9-10位可能是日期
-                        if len(sn) >= 10:
-                            day_code = sn[8:10]  # 第9-10位
-                            if day_code.isdigit():
-                                day = int(day_code)
-                                # 检查日期是否合法
-                                if 1 <= day <= 31:
-                                    # 检查该月份是否有这么多天
-                                    valid_days = {
-                                        1: 31, 2: 29, 3: 31, 4: 30, 5: 31, 6: 30,
-                                        7: 31, 8: 31, 9: 30, 10: 31, 11: 30, 12: 31
-                                    }
-                                    if day <= valid_days[month]:
-                                        print(f"  解析结果: 2025年{month}月{day}日")
-                                        return f"{year}年{month}月{day}日"
-                                    else:
-                                        # 日期太大，用该月最后一天
-                                        last_day = valid_days[month]
-                                        print(f"  解析结果: 2025年{month}月{last_day}日")
-                                        return f"{year}年{month}月{last_day}日"
-            
-            # 如果无法解析，使用合理的默认值
-            print(f"  智能推算: 2025年6月15日")
-            return f"{year}年6月15日"
-        
-        # 如果没有SN码，使用默认值
-        print(f"  智能推算: 2025年6月15日")
-        return f"{year}年6月15日"
+        # 编码规则见 SnDateDecoder：固定为2025年，第8位为月份，第9-10位为日期
+        decoder = SnDateDecoder()
+        if sn and sn != "无法获取" and len(sn) >= decoder.MIN_LENGTH:
+            log(f"分析SN码: {sn}")
+        year, month, day, parsed = decoder.decode(sn if sn != "无法获取" else '')
+        date = decoder.format(year, month, day)
+        log(f"  解析结果: {date}" if parsed else f"  智能推算: {date}")
+        return date
     
-    def scan_device_info(self):
-        """扫描设备信息（原有功能保持不变，只修改生产日期部分）"""
-        self.clear_screen()
-        print("正在扫描设备信息...")
-        print("═" * 60)
-        
-        # 先获取关键信息
-        print("获取关键信息...")
-        imei_numbers = self.get_imei_numbers()
-        serial_number = self.get_serial_number()
-        device_model = self.get_device_model()
-        
-        # 【修改】使用精确的生产日期推断
-        manufacture_date = self.estimate_manufacture_date_precise(
-            serial_number, 
-            device_model, 
-            imei_numbers[0] if imei_numbers else ""
-        )
-        
-        info_items = {
+    # 其他系统信息的探测命令
+    # 字符串为普通命令；字典为结构化探测（argv 不经过 shell 执行，extract 在进程内解析输出）
+    # 没有 'local' 时两种模式共用 'adb' 的探测
+    OTHER_INFO_COMMANDS = {
+        'CPU信息': {
+            'adb': {'argv': ['cat', '/proc/cpuinfo'], 'extract': r'^(?:model name|Hardware)\s*:\s*(.+)$'}
+        },
+        'CPU架构': {
+            'adb': 'getprop ro.product.cpu.abi',
+            'local': {'argv': ['uname', '-m']}
+        },
+        '品牌': {
+            'adb': 'getprop ro.product.brand',
+            'local': {'argv': ['cat', '/sys/devices/soc0/vendor']}
+        },
+        'Android版本': {
+            'adb': 'getprop ro.build.version.release',
+            'local': {'argv': ['cat', '/proc/version']}
+        },
+        '系统版本': {
+            'adb': 'getprop ro.build.display.id',
+            'local': {'argv': ['cat', '/etc/os-release'], 'extract': r'^PRETTY_NAME="?([^"\n]*)'}
+        },
+        '内核版本': {
+            'adb': {'argv': ['uname', '-r']}
+        },
+        '内存信息': {
+            'adb': {'argv': ['cat', '/proc/meminfo'], 'extract': r'^MemTotal:\s*(.+)$'}
+        },
+        '存储信息': {
+            'adb': {'argv': ['df', '-h', '/data'], 'extract': lambda output: output.strip().split('\n')[-1]},
+            'local': {'argv': ['df', '-h', '/'], 'extract': lambda output: output.strip().split('\n')[-1]}
+        },
+        '电池信息': {
+            'adb': {'argv': ['dumpsys', 'battery'], 'extract': r'^\s*level:\s*(\d+)'},
+            'local': {'argv': ['cat', '/sys/class/power_supply/battery/capacity'], 'default': "未知"}
+        },
+        # 与电池信息共用同一次 dumpsys battery
+        '电池温度': {
+            'adb': {'argv': ['dumpsys', 'battery'], 'extract': lambda output: battery_temperature(output)},
+            'local': {'argv': ['cat', '/sys/class/power_supply/battery/temp'], 'default': "未知",
+                      'extract': lambda output: battery_temperature(output)}
+        },
+        '电池健康': {
+            'adb': {'argv': ['dumpsys', 'battery'], 'extract': lambda output: battery_health(output)},
+            'local': {'argv': ['cat', '/sys/class/power_supply/battery/health'], 'default': "未知"}
+        }
+    }
+    
+    # 每次扫描都要重新获取的项目，其余系统信息在同一次开机内视为不变
+    VOLATILE_INFO_ITEMS = ('存储信息', '电池信息', '电池温度', '电池健康')
+    
+    def key_info_items(self, device_model, serial_number, manufacture_date):
+        """型号、SN、生产日期三项关键信息"""
+        return {
             '设备型号': {
                 'value': device_model,
                 'status': '✓' if device_model != "无法获取" else '✗'
@@ -257,8 +2170,10 @@ class DeviceManager:
                 'status': '✓' if manufacture_date != "无法精确推断" else '✗'
             }
         }
-        
-        # 添加IMEI信息
+    
+    def imei_info_items(self, imei_numbers):
+        """IMEI 关键信息：每个 IMEI 一项，一个都没有时为一项（值为 无法获取）"""
+        info_items = {}
         if imei_numbers:
             for i, imei in enumerate(imei_numbers, 1):
                 info_items[f'IMEI{i}'] = {
@@ -271,93 +2186,271 @@ class DeviceManager:
                 'status': '✗'
             }
         
-        # 其他系统信息（完全不变）
-        other_info = {
-            'CPU信息': {
-                'adb': 'cat /proc/cpuinfo | grep "model name" | head -1',
-                'local': 'cat /proc/cpuinfo | grep "model name" | head -1'
-            },
-            'CPU架构': {
-                'adb': 'getprop ro.product.cpu.abi',
-                'local': 'uname -m'
-            },
-            '品牌': {
-                'adb': 'getprop ro.product.brand',
-                'local': 'cat /sys/devices/soc0/vendor'
-            },
-            'Android版本': {
-                'adb': 'getprop ro.build.version.release',
-                'local': 'cat /proc/version'
-            },
-            '系统版本': {
-                'adb': 'getprop ro.build.display.id',
-                'local': 'cat /etc/os-release | grep "PRETTY_NAME" | cut -d= -f2'
-            },
-            '内核版本': {
-                'adb': 'uname -r',
-                'local': 'uname -r'
-            },
-            '内存信息': {
-                'adb': 'cat /proc/meminfo | grep MemTotal',
-                'local': 'cat /proc/meminfo | grep MemTotal'
-            },
-            '存储信息': {
-                'adb': 'df -h /data | tail -1',
-                'local': 'df -h / | tail -1'
-            },
-            '电池信息': {
-                'adb': 'dumpsys battery | grep level',
-                'local': 'cat /sys/class/power_supply/battery/capacity 2>/dev/null || echo "未知"'
-            }
+        return info_items
+    
+    def clean_probe_output(self, result):
+        """清理系统信息探测的输出，无有效结果时返回 None"""
+        if result and '错误' not in result and result not in ['', 'unknown', 'Unknown']:
+            lines = result.split('\n')
+            if lines:
+                clean_result = lines[0].strip()
+                
+                # 进一步清理
+                if ':' in clean_result:
+                    clean_result = clean_result.split(':')[-1].strip()
+                if '=' in clean_result:
+                    clean_result = clean_result.split('=')[-1].strip().strip('"')
+                
+                if clean_result and len(clean_result) > 0:
+                    return clean_result
+        return None
+    
+    def probe_value(self, command, result):
+        """把探测结果转换成显示值，无有效结果时返回 None"""
+        if isinstance(command, dict):
+            result = (result or '').strip()
+            return result if result not in ['', 'unknown', 'Unknown'] else None
+        return self.clean_probe_output(result)
+    
+    def system_probe_command(self, item):
+        commands = self.OTHER_INFO_COMMANDS[item]
+        return commands.get(self.mode, commands['adb'])
+    
+    def start_system_probes(self, skip=()):
+        """并发启动系统信息探测（skip 中的项目除外），返回 {项目: Task}（需在事件循环中调用）"""
+        semaphore = asyncio.Semaphore(self.ASYNC_PROBE_LIMIT)
+        
+        async def probe(cmd):
+            async with semaphore:
+                return await self.query_async(cmd)
+        
+        return {
+            item: asyncio.create_task(probe(self.system_probe_command(item)))
+            for item in self.OTHER_INFO_COMMANDS if item not in skip
         }
+    
+    async def iter_scan_async(self, verbose=True):
+        """流式扫描：每得到一项就产生一个 (分区, 项目, 值)，不等整个扫描结束
         
-        # 先显示关键信息
-        print("\n【关键信息】")
-        print("-" * 40)
-        for item, data in info_items.items():
-            value = str(data['value'])
-            if len(value) > 40:
-                value = value[:37] + "..."
-            print(f"{data['status']} {item:.<15}: {value}")
+        分区为 'key'（值为 {'value', 'status'}）或 'system'（值为显示值，无结果时为 None），按得到的先后顺序产生；
+        关键信息全部得到后额外产生一次 ('key', None, info_items)。扫描结束后系统信息存入 self.device_info。
+        """
+        self.command_errors = []
+        if self.mode == 'adb' and self.replay is None:
+            await asyncio.to_thread(self.refresh_breaker)
+        await asyncio.to_thread(self.load_prop_snapshot)
+        dumpsys_path = None
+        if self.dumpsys_bulk is not None and self.mode == 'adb' and self.replay is None:
+            dumpsys_path = await asyncio.to_thread(self.open_dumpsys_bulk)
+        try:
+            async for event in self.iter_scan_probes(verbose):
+                yield event
+        finally:
+            self.close_dumpsys_bulk(dumpsys_path)
+    
+    async def iter_scan_probes(self, verbose):
+        """iter_scan_async 的探测部分（属性快照已读取）"""
+        key, identity = self.device_identity()
+        # 录制时总是完整扫描，保证档案能独立回放
+        use_cache = self.use_static_cache and key and self.capture is None
+        cached = self.static_cache.get(key, identity) if use_cache else None
+        self.static_cache_hit = cached is not None
+        self.device_info = {}
+        
+        if cached:
+            # 同一次开机、同一系统版本：静态信息直接用缓存，只探测易变项目
+            info_items, cached_info = cached
+            probe_tasks = self.start_system_probes(skip=cached_info)
+            pending = {}
+            for item, data in info_items.items():
+                yield 'key', item, data
+            yield 'key', None, info_items
+        else:
+            cached_info = {}
+            probe_tasks = self.start_system_probes()
+            # IMEI 的批量脚本最慢，放在后台；型号、SN 一般直接来自属性快照
+            imei_task = asyncio.ensure_future(asyncio.to_thread(self.get_imei_numbers))
+            pending = {imei_task: None}
+            info_items = await asyncio.to_thread(self.collect_identity_info, verbose)
+            for item, data in info_items.items():
+                yield 'key', item, data
         
-        print("\n【系统信息】")
+        for item, value in cached_info.items():
+            self.device_info[item] = value
+            yield 'system', item, value
+        pending.update((task, item) for item, task in probe_tasks.items())
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                item = pending.pop(task)
+                if item is None:
+                    imei_items = self.imei_info_items(task.result())
+                    info_items.update(imei_items)
+                    for imei_item, data in imei_items.items():
+                        yield 'key', imei_item, data
+                    yield 'key', None, info_items
+                    continue
+                value = self.probe_value(self.system_probe_command(item), task.result())
+                if value:
+                    self.device_info[item] = value
+                yield 'system', item, value
+        
+        # 结果仍按表格顺序保存
+        self.device_info = {item: self.device_info[item] for item in self.OTHER_INFO_COMMANDS
+                            if item in self.device_info}
+        if key and not cached and all(data['status'] == '✓' for data in info_items.values()):
+            static_info = {item: value for item, value in self.device_info.items()
+                           if item not in self.VOLATILE_INFO_ITEMS}
+            self.static_cache.put(key, identity, info_items, static_info)
+    
+    def collect_identity_info(self, verbose=True):
+        """型号、SN 与生产日期（不含 IMEI），返回 info_items"""
+        serial_number = self.get_serial_number()
+        device_model = self.get_device_model()
+        manufacture_date = self.estimate_manufacture_date_precise(serial_number, device_model, "", verbose=verbose)
+        return self.key_info_items(device_model, serial_number, manufacture_date)
+    
+    async def collect_scan_async(self, verbose=True, on_field=None):
+        """异步扫描引擎：消费 iter_scan_async，每得到一项回调 on_field(分区, 项目, 值)，返回 info_items"""
+        info_items = {}
+        async for section, item, data in self.iter_scan_async(verbose):
+            if section == 'key' and item is None:
+                info_items = data
+            if on_field:
+                on_field(section, item, data)
+        return info_items
+    
+    def collect_scan(self, verbose=True, on_field=None):
+        """完整扫描（阻塞接口），返回 info_items，系统信息存入 self.device_info"""
+        if not self.capture_dir or self.mode != 'adb' or self.replay is not None:
+            return asyncio.run(self.collect_scan_async(verbose, on_field))
+        
+        # 录制：本次扫描的全部设备端命令写入一个档案
+        self.capture = CaptureArchive(self.serial)
+        try:
+            return asyncio.run(self.collect_scan_async(verbose, on_field))
+        finally:
+            capture, self.capture = self.capture, None
+            serial = self.serial or (self.prop_snapshot or {}).get('ro.serialno')
+            try:
+                capture.save(self.capture_dir, serial)
+            except OSError as e:
+                print(f"保存录制档案失败: {e}", file=sys.stderr)
+    
+    def use_replay(self, archive):
+        """切换到回放后端：不连接设备，设备端命令全部由档案应答"""
+        self.replay = archive
+        self.serial = archive.serial
+        self.mode = 'adb'
+        self.use_shell_session = False
+        self.adb_client = None
+    
+    def scan_replay(self, path):
+        """回放一个录制档案并扫描（结果结构与 scan_single_device 相同）"""
+        start = time.monotonic()
+        # 回放是为了重新跑解析逻辑，不使用静态信息缓存
+        worker = DeviceManager(mode='adb', tracer=self.tracer)
+        worker.use_static_cache = False
+        info_items, error, serial = {}, None, path
+        try:
+            archive = CaptureArchive.load(path)
+            worker.use_replay(archive)
+            serial = archive.serial or path
+            info_items = worker.collect_scan(verbose=False)
+            if archive.misses:
+                error = f"档案中缺少 {len(archive.misses)} 条命令: {archive.misses[0]}"
+        except (OSError, ValueError) as e:
+            error = str(e)
+        
+        return {
+            'serial': serial,
+            'mode': 'replay',
+            'info_items': info_items,
+            'device_info': worker.device_info,
+            'success_count': worker.count_successes(info_items, worker.device_info),
+            'total_items': len(info_items) + len(self.OTHER_INFO_COMMANDS),
+            'elapsed': time.monotonic() - start,
+            'error': error
+        }
+    
+    def print_section_header(self, title):
+        print(f"\n【{title}】")
         print("-" * 40)
+    
+    def print_key_item(self, item, data):
+        """显示一项关键信息"""
+        value = str(data['value'])
+        if len(value) > 40:
+            value = value[:37] + "..."
+        print(f"{data['status']} {item:.<15}: {value}")
+    
+    def scan_printer(self):
+        """扫描结果的控制台输出：每得到一项立即显示；关键信息未齐时先到的系统信息暂存，关键信息齐后再显示"""
+        waiting = []
+        key_started = key_done = False
         
-        # 获取其他信息（完全不变）
-        for item, commands in other_info.items():
-            cmd = commands.get(self.mode, commands['adb'])
-            result = self.run_command(cmd)
-            
-            if result and '错误' not in result and result not in ['', 'unknown', 'Unknown']:
-                # 清理输出结果
-                lines = result.split('\n')
-                if lines:
-                    clean_result = lines[0].strip()
-                    
-                    # 进一步清理
-                    if ':' in clean_result:
-                        clean_result = clean_result.split(':')[-1].strip()
-                    if '=' in clean_result:
-                        clean_result = clean_result.split('=')[-1].strip().strip('"')
-                    
-                    if clean_result and len(clean_result) > 0:
-                        display_value = clean_result[:50]
-                        if len(clean_result) > 50:
-                            display_value = clean_result[:47] + "..."
-                        print(f"✓ {item:.<15}: {display_value}")
-                        self.device_info[item] = clean_result
-                        continue
-            
+        def on_field(section, item, data):
+            nonlocal key_started, key_done
+            if section == 'system':
+                if key_done:
+                    self.print_system_item(item, data)
+                else:
+                    waiting.append((item, data))
+            elif item is None:
+                key_done = True
+                self.print_section_header("系统信息")
+                for waiting_item, value in waiting:
+                    self.print_system_item(waiting_item, value)
+                waiting.clear()
+            else:
+                if not key_started:
+                    key_started = True
+                    self.print_section_header("关键信息")
+                self.print_key_item(item, data)
+        return on_field
+    
+    def print_system_item(self, item, value):
+        """显示一项系统信息"""
+        if value:
+            display_value = value[:50]
+            if len(value) > 50:
+                display_value = value[:47] + "..."
+            print(f"✓ {item:.<15}: {display_value}")
+        else:
             print(f"✗ {item:.<15}: 无法获取")
+    
+    def count_successes(self, info_items, device_info):
+        """统计获取成功的信息项数"""
+        return sum(1 for item in list(info_items.values()) + list(device_info.values()) 
+                   if item != "无法获取" and "无法获取" not in str(item))
+    
+    def scan_device_info(self):
+        """扫描设备信息（原有功能保持不变，只修改生产日期部分）"""
+        self.clear_screen()
+        print("正在扫描设备信息...")
+        print("═" * 60)
+        
+        # 先获取关键信息（系统信息探测同时在后台进行）
+        print("获取关键信息...")
+        self.tracer.reset()
+        info_items = self.collect_scan(on_field=self.scan_printer())
         
         print("═" * 60)
         
         # 显示统计信息
-        total_items = len(info_items) + len(other_info)
-        success_count = sum(1 for item in list(info_items.values()) + list(self.device_info.values()) 
-                           if item != "无法获取" and "无法获取" not in str(item))
+        total_items = len(info_items) + len(self.OTHER_INFO_COMMANDS)
+        success_count = self.count_successes(info_items, self.device_info)
         
         print(f"\n扫描完成: {success_count}/{total_items} 项信息获取成功")
+        scan_error = self.scan_error()
+        if scan_error:
+            print(f"⚠ {scan_error}")
+        if self.static_cache_hit:
+            print("（设备未重启，型号、SN、IMEI 等静态信息来自上次扫描的缓存）")
+        self.tracer.print_summary()
+        self.export_trace()
+        self.record_scan(info_items, self.device_info, self.serial)
+        self.export_scan(info_items, self.device_info, self.serial, error=scan_error)
         
         # 保存到文件（完全不变）
         save_choice = input("\n是否保存扫描结果到文件？(y/n): ").strip().lower()
@@ -366,6 +2459,263 @@ class DeviceManager:
         
         input("\n按回车键返回主菜单...")
     
+    def export_trace(self):
+        """指定了 --trace 时导出本次扫描的命令时间线"""
+        if not self.trace_path:
+            return
+        try:
+            self.tracer.export(self.trace_path, self.trace_format)
+            print(f"命令时间线已保存到: {os.path.abspath(self.trace_path)}")
+        except Exception as e:
+            print(f"保存时间线失败: {e}")
+    
+    def record_scan(self, info_items, device_info, serial=None, mode=None):
+        """启用了扫描历史库时追加一条扫描记录"""
+        if not self.scan_store:
+            return
+        try:
+            self.scan_store.add_scan(info_items, device_info, serial=serial, mode=mode or self.mode)
+        except sqlite3.Error as e:
+            print(f"写入扫描历史失败: {e}", file=sys.stderr)
+    
+    def export_scan(self, info_items, device_info, serial=None, elapsed=None, error=None, mode=None):
+        """启用了结构化导出时立即追加一条记录"""
+        if not self.exporter:
+            return
+        try:
+            self.exporter.write(info_items, device_info, serial=serial, mode=mode or self.mode,
+                                elapsed=elapsed, error=error)
+        except (OSError, ValueError) as e:
+            print(f"导出扫描结果失败: {e}", file=sys.stderr)
+    
+    def list_adb_serials(self):
+        """列出 adb devices 中所有处于 device 状态的序列号"""
+        return [serial for serial, state in self.list_adb_devices() or [] if state == 'device']
+    
+    def scan_single_device(self, serial, on_field=None):
+        """多设备扫描的单台任务：用独立的 DeviceManager 扫描指定序列号
+        
+        提供 on_field 时每得到一项回调 on_field(序列号, 分区, 项目, 值, 已用秒数)（在工作线程中调用）。
+        """
+        worker = DeviceManager(mode='adb', serial=serial, tracer=self.tracer, static_cache=self.static_cache,
+                               breakers=self.breakers)
+        # 后端选择沿用当前设置（是否复用 shell 会话、是否直连 adb server）
+        worker.use_shell_session = self.use_shell_session
+        worker.adb_client = self.adb_client
+        worker.use_static_cache = self.use_static_cache
+        worker.capture_dir = self.capture_dir
+        worker.dumpsys_bulk = self.dumpsys_bulk
+        worker.dumpsys_dir = self.dumpsys_dir
+        start = time.monotonic()
+        info_items, error = {}, None
+        
+        def on_worker_field(section, item, data):
+            on_field(serial, section, item, data, time.monotonic() - start)
+        
+        try:
+            info_items = worker.collect_scan(verbose=False, on_field=on_worker_field if on_field else None)
+            error = worker.scan_error()
+        except Exception as e:
+            error = str(e)
+        finally:
+            worker.close_shell_session()
+        
+        return {
+            'serial': serial,
+            'info_items': info_items,
+            'device_info': worker.device_info,
+            'success_count': worker.count_successes(info_items, worker.device_info),
+            'total_items': len(info_items) + len(self.OTHER_INFO_COMMANDS),
+            'elapsed': time.monotonic() - start,
+            'error': error
+        }
+    
+    def scan_fleet(self, serials=None, max_workers=None, verbose=True, on_field=None, on_result=None):
+        """并行扫描多台设备，每台设备一个结果，按序列号顺序返回（verbose=False 时不显示进度）
+        
+        提供 on_field 时各台设备每得到一项就回调一次（参数见 scan_single_device），on_result 见 run_fleet。
+        """
+        if serials is None:
+            serials = self.list_adb_serials()
+        task = self.scan_single_device
+        if on_field:
+            task = lambda serial: self.scan_single_device(serial, on_field)
+        return self.run_fleet(task, serials, max_workers, verbose, on_result)
+    
+    def run_fleet(self, task, serials, max_workers=None, verbose=True, on_result=None):
+        """用线程池对每个序列号执行 task(serial)，结果逐台导出，按序列号顺序返回
+        
+        提供 on_result 时每台结果导出后交给 on_result(结果)，只保留它的返回值，完整结果不留在内存里。
+        """
+        if not serials:
+            return []
+        
+        max_workers = min(max_workers or self.FLEET_MAX_WORKERS, len(serials))
+        results = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(task, serial): serial for serial in serials}
+            for future in as_completed(futures):
+                result = future.result()
+                self.export_scan(result['info_items'], result['device_info'], result['serial'],
+                                 result['elapsed'], result['error'], result.get('mode'))
+                results[futures[future]] = on_result(result) if on_result else result
+                if verbose:
+                    status = '✗' if result['error'] else '✓'
+                    print(f"{status} [{len(results)}/{len(serials)}] {result['serial']:<20} "
+                          f"{result['success_count']}/{result['total_items']} 项  {result['elapsed']:.1f}s")
+        
+        return [results[serial] for serial in serials]
+    
+    # getvar 变量 → 扫描项目；第三项为取值的显示映射
+    FASTBOOT_INFO_VARS = [
+        ('设备型号', 'product', None),
+        ('序列号(SN)', 'serialno', None),
+        ('解锁状态', 'unlocked', {'yes': '已解锁', 'no': '未解锁'}),
+        ('安全启动', 'secure', {'yes': '开启', 'no': '关闭'}),
+        ('Bootloader版本', 'version-bootloader', None),
+        ('基带版本', 'version-baseband', None),
+        ('硬件版本', 'hw-revision', None),
+        ('当前槽位', 'current-slot', None),
+    ]
+    FASTBOOT_GETVAR_TIMEOUT = 15  # 单台设备 getvar all 的超时秒数
+    
+    def parse_getvar_all(self, output):
+        """解析 fastboot getvar all 的输出（在 stderr 上，每行 "(bootloader) 变量: 值"），返回 {变量: 值}"""
+        variables = {}
+        for line in output.splitlines():
+            line = line.strip()
+            if not line.startswith('(bootloader)'):
+                continue
+            entry = line[len('(bootloader)'):].strip()
+            # partition-size:system: 0x... 这类变量名本身带冒号，按最后一个 ": " 分隔
+            if ': ' in entry:
+                name, value = entry.rsplit(': ', 1)
+            elif ':' in entry:
+                name, value = entry.split(':', 1)
+            else:
+                continue
+            variables.setdefault(name.strip(), value.strip())
+        return variables
+    
+    @classmethod
+    def export_columns(cls):
+        """结构化导出的列：系统信息项目和 Fastboot 扫描的项目"""
+        columns = list(cls.OTHER_INFO_COMMANDS)
+        columns += [item for item, _, _ in cls.FASTBOOT_INFO_VARS if item not in ScanExporter.KEY_COLUMNS]
+        return columns
+    
+    def fastboot_info_items(self, variables):
+        """getvar 变量 → 与 ADB 扫描相同结构的 info_items"""
+        info_items = {}
+        for item, name, labels in self.FASTBOOT_INFO_VARS:
+            value = variables.get(name, '')
+            if not value and item not in ('设备型号', '序列号(SN)'):
+                continue
+            if labels:
+                value = labels.get(value.lower(), value)
+            info_items[item] = {'value': value or "无法获取", 'status': '✓' if value else '✗'}
+        return info_items
+    
+    def fastboot_getvar_all(self, serial, timeout=None):
+        """执行一次 fastboot -s 序列号 getvar all，返回合并后的输出"""
+        argv = ['fastboot', '-s', serial, 'getvar', 'all']
+        with self.traced(' '.join(argv[3:]), serial) as stats:
+            result = subprocess.run(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                    timeout=timeout or self.FASTBOOT_GETVAR_TIMEOUT)
+            output = result.stdout.decode('utf-8', errors='ignore')
+            stats.update(backend='fastboot', exit_code=result.returncode, output_size=len(output))
+            return output
+    
+    def scan_fastboot_device(self, serial):
+        """扫描一台处于 Fastboot 模式的设备（结果结构与 scan_single_device 相同）"""
+        start = time.monotonic()
+        info_items, variables, error = {}, {}, None
+        try:
+            variables = self.parse_getvar_all(self.fastboot_getvar_all(serial))
+            if not variables:
+                error = "getvar all 没有返回任何变量"
+            info_items = self.fastboot_info_items(variables)
+        except (OSError, subprocess.SubprocessError) as e:
+            error = str(e)
+        
+        return {
+            'serial': serial,
+            'mode': 'fastboot',
+            'info_items': info_items,
+            'device_info': {},
+            'getvar': variables,
+            'success_count': sum(1 for data in info_items.values() if data['status'] == '✓'),
+            'total_items': len(info_items),
+            'elapsed': time.monotonic() - start,
+            'error': error
+        }
+    
+    def list_fastboot_serials(self):
+        """列出 Fastboot 模式的设备序列号，fastboot 不可用时返回空列表"""
+        try:
+            return [serial for serial, _ in self.probe_fastboot_devices(self.DETECT_TIMEOUT)]
+        except (OSError, subprocess.SubprocessError):
+            return []
+    
+    def scan_fastboot_fleet(self, serials=None, max_workers=None, verbose=True, on_result=None):
+        """并行扫描多台 Fastboot 设备（每台一次 getvar all），按序列号顺序返回（on_result 见 run_fleet）"""
+        if serials is None:
+            serials = self.list_fastboot_serials()
+        return self.run_fleet(self.scan_fastboot_device, serials, max_workers, verbose, on_result)
+    
+    def fleet_scan(self):
+        """多设备并行扫描（汇总报告）"""
+        self.clear_screen()
+        print("多设备并行扫描")
+        print("═" * 60)
+        
+        if self.mode != 'adb':
+            print("多设备扫描仅支持电脑模式 (ADB)")
+            input("\n按回车键返回主菜单...")
+            return
+        
+        serials = self.list_adb_serials()
+        fastboot_serials = self.list_fastboot_serials()
+        if not serials and not fastboot_serials:
+            print("未找到连接的设备！")
+            input("\n按回车键返回主菜单...")
+            return
+        
+        print(f"找到 {len(serials) + len(fastboot_serials)} 个设备"
+              f"（Fastboot 模式 {len(fastboot_serials)} 台），最多同时扫描 {self.FLEET_MAX_WORKERS} 台\n")
+        self.tracer.reset()
+        start = time.monotonic()
+        results = self.scan_fleet(serials) + self.scan_fastboot_fleet(fastboot_serials)
+        total_elapsed = time.monotonic() - start
+        
+        # 汇总报告
+        print("\n【汇总报告】")
+        print("-" * 60)
+        print(f"{'设备':<20}{'型号':<14}{'SN':<20}{'IMEI1'}")
+        for result in results:
+            info_items = result['info_items']
+            model = info_items.get('设备型号', {}).get('value', "无法获取")
+            sn = info_items.get('序列号(SN)', {}).get('value', "无法获取")
+            imei = info_items.get('IMEI1', {}).get('value', "无法获取")
+            print(f"{result['serial']:<20}{model:<14}{sn:<20}{imei}")
+        print("═" * 60)
+        
+        slowest = max(results, key=lambda r: r['elapsed'])
+        failed = sum(1 for r in results if r['error'])
+        print(f"\n扫描完成: {len(results)} 台设备，失败 {failed} 台")
+        print(f"总耗时: {total_elapsed:.1f}s（最慢设备 {slowest['serial']}: {slowest['elapsed']:.1f}s）")
+        self.tracer.print_summary()
+        self.export_trace()
+        for result in results:
+            if not result['error']:
+                self.record_scan(result['info_items'], result['device_info'], result['serial'], result.get('mode'))
+        
+        save_choice = input("\n是否保存汇总报告到文件？(y/n): ").strip().lower()
+        if save_choice == 'y':
+            self.save_fleet_report(results)
+        
+        input("\n按回车键返回主菜单...")
+    
     def save_scan_results(self, info_items):
         """保存扫描结果到文件（原有功能保持不变）"""
         try:
@@ -403,6 +2753,39 @@ class DeviceManager:
         except Exception as e:
             print(f"保存文件失败: {e}")
     
+    def save_fleet_report(self, results):
+        """保存多设备扫描汇总报告"""
+        try:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"fleet_scan_{timestamp}.txt"
+            
+            with open(filename, 'w', encoding='utf-8') as f:
+                f.write("=" * 60 + "\n")
+                f.write("多设备扫描汇总报告\n")
+                f.write("=" * 60 + "\n")
+                f.write(f"扫描时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+                f.write(f"设备数量: {len(results)}\n")
+                f.write("-" * 60 + "\n")
+                
+                for result in results:
+                    f.write(f"\n【设备 {result['serial']}】\n")
+                    f.write("-" * 40 + "\n")
+                    if result['error']:
+                        f.write(f"扫描出错: {result['error']}\n")
+                    for item, data in result['info_items'].items():
+                        f.write(f"{item}: {data['value']}\n")
+                    for item, value in result['device_info'].items():
+                        f.write(f"{item}: {value}\n")
+                    f.write(f"扫描耗时: {result['elapsed']:.1f}s\n")
+                
+                f.write("\n" + "=" * 60 + "\n")
+            
+            print(f"汇总报告已保存到: {filename}")
+            print(f"文件路径: {os.path.abspath(filename)}")
+            
+        except Exception as e:
+            print(f"保存文件失败: {e}")
+    
     def generate_unlock_code(self):
         """生成解锁码（原有功能保持不变）"""
         self.clear_screen()
@@ -433,7 +2816,7 @@ class DeviceManager:
                     print("此项为必填项，请输入有效值！")
         
         print("\n正在生成解锁码...")
-        time.sleep(1)
+        self.pause(1)
         
         combined = ''.join([f"{k}:{v}" for k, v in user_input.items()])
         unlock_hash = hashlib.md5(combined.encode()).hexdigest()
@@ -472,45 +2855,171 @@ class DeviceManager:
         
         input("\n按回车键返回主菜单...")
     
-    def detect_device_mode_for_unlock(self):
-        """【专门用于解锁功能】检测设备模式"""
-        print("\n正在检测设备当前模式...")
+    def probe_adb_devices(self, timeout):
+        """探测ADB模式设备，返回 [(序列号, 'normal'), ...]"""
+        if self.registry is not None:
+            devices = self.registry.adb_devices()
+            if devices is not None:
+                return [(serial, 'normal') for serial, state in devices if state == 'device']
+        
+        client = self.get_adb_client()
+        if client is not None:
+            try:
+                return [(serial, 'normal') for serial, state in client.devices() if state == 'device']
+            except (OSError, AdbProtocolError):
+                pass
+        
+        result = subprocess.run(['adb', 'devices'], capture_output=True, text=True, timeout=timeout)
+        devices = []
+        if 'List of devices attached' in result.stdout:
+            for line in result.stdout.split('\n'):
+                parts = line.split()
+                if len(parts) >= 2 and parts[1] == 'device' and not line.startswith('List'):
+                    devices.append((parts[0], 'normal'))
+        return devices
+    
+    def probe_fastboot_devices(self, timeout):
+        """探测Fastboot模式设备，返回 [(序列号, 'fastboot'), ...]"""
+        if self.registry is not None:
+            devices = self.registry.fastboot_devices()
+            if devices is not None:
+                return devices
+        return self.run_fastboot_devices(timeout)
+    
+    def run_fastboot_devices(self, timeout):
+        """执行 fastboot devices，返回 [(序列号, 'fastboot'), ...]"""
+        result = subprocess.run(['fastboot', 'devices'], capture_output=True, text=True, timeout=timeout)
+        return [(line.split()[0], 'fastboot') for line in result.stdout.split('\n') if line.strip()]
+    
+    def probe_edl_devices(self, timeout):
+        """探测9008模式设备（Windows），返回 [(设备名, '9008'), ...]"""
+        result = subprocess.run(
+            ['wmic', 'path', 'Win32_PnPEntity', 'get', 'Name'],
+            capture_output=True, text=True, timeout=timeout
+        )
+        return [(line.strip(), '9008') for line in result.stdout.split('\n')
+                if '9008' in line or 'QDLoader' in line]
+    
+    def reboot_to_bootloader(self, serial, timeout=None):
+        """让指定设备重启到 bootloader，命令发出成功返回 True"""
+        timeout = timeout or self.DETECT_TIMEOUT
+        with self.traced('reboot bootloader', serial) as stats:
+            client = self.get_adb_client()
+            if client is not None:
+                try:
+                    with client.open_service(serial, 'reboot:bootloader') as sock:
+                        sock.settimeout(timeout)
+                        client._read_all(sock)
+                    stats.update(backend='socket', exit_code=0)
+                    return True
+                except (OSError, AdbProtocolError):
+                    pass
+            try:
+                result = subprocess.run(['adb'] + (['-s', serial] if serial else []) + ['reboot', 'bootloader'],
+                                        capture_output=True, text=True, timeout=timeout)
+            except (OSError, subprocess.SubprocessError):
+                stats.update(backend='process', exit_code=None)
+                return False
+            stats.update(backend='process', exit_code=result.returncode)
+            return result.returncode == 0
+    
+    def print_stage_change(self, serial, state, counts):
+        """批量进入 Fastboot 时的实时进度：状态变化一行，加上各状态的汇总"""
+        names = FleetStager.STATE_NAMES
+        summary = '  '.join(f"{names[s]} {n}" for s, n in counts.items() if n)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {serial:<20} → {names[state]:<8} | {summary}")
+    
+    def stage_fleet(self):
+        """批量进入Fastboot：所有设备并发重启到 Fastboot，之后逐台确认是否解锁"""
+        self.clear_screen()
+        print("批量进入Fastboot")
         print("═" * 60)
         
-        detected_modes = []
+        serials = self.list_adb_serials() + self.list_fastboot_serials()
+        if not serials:
+            print("未找到连接的设备！")
+            input("\n按回车键返回主菜单...")
+            return
+        
+        print(f"找到 {len(serials)} 个设备，最多同时重启 {self.FLEET_MAX_WORKERS} 台，"
+              f"每台最长等待 {self.fastboot_timeout:g} 秒\n")
+        stager = FleetStager(self, serials, on_change=self.print_stage_change)
+        states = stager.run()
         
-        # 1. 检测ADB模式
-        try:
-            adb_result = subprocess.run('adb devices', shell=True, capture_output=True, text=True)
-            if 'List of devices attached' in adb_result.stdout:
-                lines = [line for line in adb_result.stdout.split('\n') if 'device' in line and not line.startswith('List')]
-                if lines:
-                    detected_modes.append(('ADB模式', 'normal'))
-                    print("✓ 检测到ADB模式（正常开机）")
-        except:
-            pass
+        ready = [serial for serial, state in states.items() if state == 'ready']
+        print("═" * 60)
+        print(f"进入Fastboot: {len(ready)}/{len(serials)} 台")
+        for serial, state in states.items():
+            if state != 'ready':
+                error = stager.details[serial].get('error', '')
+                print(f"  ✗ {serial}: {FleetStager.STATE_NAMES[state]} {error}")
         
-        # 2. 检测Fastboot模式
+        # 批量操作只到这里为止；解锁会清除数据，必须逐台确认
+        original_serial = self.serial
         try:
-            fastboot_result = subprocess.run('fastboot devices', shell=True, capture_output=True, text=True)
-            if fastboot_result.stdout.strip():
-                detected_modes.append(('Fastboot模式', 'fastboot'))
-                print("✓ 检测到Fastboot模式（可解锁）")
-        except:
-            pass
+            for serial in ready:
+                unlocked = stager.details[serial]['info_items'].get('解锁状态', {}).get('value', '未知')
+                choice = input(f"\n是否继续解锁 {serial}（当前: {unlocked}）？(y/n): ").strip().lower()
+                if choice == 'y':
+                    self.serial = serial
+                    self.confirm_and_unlock('fastboot')
+        finally:
+            self.serial = original_serial
         
-        # 3. 检测9008模式（Windows）
+        input("\n按回车键返回主菜单...")
+    
+    def detect_devices(self, timeout=None):
+        """非交互地检测所有设备：各探测并发执行、各自限时，返回 [(序列号, 模式), ...]"""
+        timeout = timeout or self.DETECT_TIMEOUT
+        probes = [self.probe_adb_devices, self.probe_fastboot_devices]
         if os.name == 'nt':
+            probes.append(self.probe_edl_devices)
+        
+        pool = ThreadPoolExecutor(max_workers=len(probes))
+        futures = [pool.submit(probe, timeout) for probe in probes]
+        # 子进程超时会被 subprocess.run 结束；这里再加一道总时限，卡住的探测直接放弃
+        wait(futures, timeout=timeout + 1)
+        pool.shutdown(wait=False, cancel_futures=True)
+        
+        detected = []
+        for future in futures:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                detected.extend(future.result())
+        return detected
+    
+    def wait_for_fastboot(self, serial=None, timeout=None):
+        """轮询等待设备出现在Fastboot中（指数退避），返回序列号，超时返回 None"""
+        deadline = time.monotonic() + (timeout or self.fastboot_timeout)
+        interval = 0.25
+        while True:
+            remaining = deadline - time.monotonic()
             try:
-                wmic_result = subprocess.run('wmic path Win32_PnPEntity get Name', shell=True, capture_output=True, text=True)
-                if '9008' in wmic_result.stdout or 'QDLoader' in wmic_result.stdout:
-                    detected_modes.append(('9008模式', '9008'))
-                    print("✓ 检测到9008模式（高通EDL）")
-            except:
-                pass
+                devices = self.run_fastboot_devices(max(min(remaining, self.DETECT_TIMEOUT), 0.1))
+            except (OSError, subprocess.SubprocessError):
+                devices = []
+            for device_serial, _ in devices:
+                if serial is None or device_serial == serial:
+                    return device_serial
+            
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, 2)
+    
+    def detect_device_mode_for_unlock(self):
+        """【专门用于解锁功能】检测设备模式，返回选中的 (序列号, 模式)，没有设备时返回 None"""
+        print("\n正在检测设备当前模式...")
+        print("═" * 60)
         
-        # 4. 没有检测到任何模式
-        if not detected_modes:
+        mode_names = {'normal': 'ADB模式', 'fastboot': 'Fastboot模式', '9008': '9008模式'}
+        mode_notes = {'normal': '正常开机', 'fastboot': '可解锁', '9008': '高通EDL'}
+        detected = [(serial, mode) for serial, mode in self.detect_devices() if mode in mode_names]
+        for serial, mode in detected:
+            print(f"✓ 检测到{mode_names[mode]}（{mode_notes[mode]}）: {serial}")
+        
+        # 没有检测到任何模式
+        if not detected:
             print("✗ 未检测到任何设备连接")
             print("\n可能的原因：")
             print("1. 设备未连接")
@@ -520,24 +3029,24 @@ class DeviceManager:
         
         print("═" * 60)
         
-        # 如果有多个模式，让用户选择
-        if len(detected_modes) > 1:
-            print("\n检测到多个模式，请选择：")
-            for i, (mode_name, _) in enumerate(detected_modes, 1):
-                print(f"{i}. {mode_name}")
+        # 如果有多台设备，让用户选择要解锁的那一台
+        if len(detected) > 1:
+            print("\n检测到多台设备，请选择：")
+            for i, (serial, mode) in enumerate(detected, 1):
+                print(f"{i}. {serial:<20} {mode_names[mode]}")
             
             while True:
                 try:
-                    choice = int(input(f"\n请选择 (1-{len(detected_modes)}): ").strip())
-                    if 1 <= choice <= len(detected_modes):
-                        return detected_modes[choice-1][1]
+                    choice = int(input(f"\n请选择 (1-{len(detected)}): ").strip())
+                    if 1 <= choice <= len(detected):
+                        return detected[choice-1]
                     else:
                         print("无效选择！")
                 except:
                     print("请输入数字！")
         else:
-            # 只有一个模式
-            return detected_modes[0][1]
+            # 只有一台设备
+            return detected[0]
     
     def unlock_bootloader(self):
         """【修改】解锁Bootloader - 添加模式检测"""
@@ -546,14 +3055,27 @@ class DeviceManager:
         print("═" * 60)
         
         # 先检测设备模式
-        device_mode = self.detect_device_mode_for_unlock()
+        selected = self.detect_device_mode_for_unlock()
         
-        if not device_mode:
+        if not selected:
             print("无法检测到设备，请检查连接后重试")
             input("\n按回车键返回...")
             return
         
-        print(f"\n设备当前模式: {device_mode.upper()}")
+        # 之后的重启、等待和解锁都只针对选中的设备；结束后恢复原来的设备选择
+        serial, device_mode = selected
+        previous_serial = self.serial
+        self.serial = serial
+        try:
+            self.unlock_selected_device(device_mode)
+        finally:
+            if self.serial != previous_serial:
+                self.close_shell_session()
+            self.serial = previous_serial
+    
+    def unlock_selected_device(self, device_mode):
+        """对 self.serial 指定的设备执行解锁流程（必要时先送进 Fastboot）"""
+        print(f"\n设备当前模式: {device_mode.upper()}（{self.serial}）")
         
         # 根据模式给出不同提示
         if device_mode == 'normal':
@@ -564,17 +3086,20 @@ class DeviceManager:
             if enter_fastboot == 'y':
                 print("正在重启到Fastboot模式...")
                 try:
-                    result = subprocess.run('adb reboot bootloader', shell=True, capture_output=True, text=True)
-                    print(f"结果: {result.stdout}")
-                    print("等待设备进入Fastboot...")
-                    time.sleep(5)
+                    # 多台设备时只重启选中的那一台
+                    if not self.reboot_to_bootloader(self.serial):
+                        print("adb reboot bootloader 失败")
+                        input("\n按回车键返回...")
+                        return
+                    print(f"等待设备进入Fastboot（最长 {self.fastboot_timeout} 秒）...")
                     
-                    # 重新检测模式
-                    device_mode = self.detect_device_mode_for_unlock()
-                    if device_mode != 'fastboot':
+                    # 设备一出现在Fastboot中就继续
+                    if not self.wait_for_fastboot(self.serial):
                         print("未能成功进入Fastboot模式")
                         input("\n按回车键返回...")
                         return
+                    print("✓ 检测到Fastboot模式（可解锁）")
+                    device_mode = 'fastboot'
                 except:
                     print("进入Fastboot失败")
                     input("\n按回车键返回...")
@@ -586,12 +3111,14 @@ class DeviceManager:
                 print("3. 进入Fastboot后继续")
                 input("\n按提示操作后按回车键继续...")
                 
-                # 重新检测模式
-                device_mode = self.detect_device_mode_for_unlock()
-                if device_mode != 'fastboot':
+                # 等待设备出现在Fastboot中
+                print("正在检测Fastboot模式...")
+                if not self.wait_for_fastboot(self.serial):
                     print("未检测到Fastboot模式")
                     input("\n按回车键返回...")
                     return
+                print("✓ 检测到Fastboot模式（可解锁）")
+                device_mode = 'fastboot'
         
         elif device_mode == '9008':
             print("设备处于9008模式（高通EDL模式）")
@@ -607,6 +3134,11 @@ class DeviceManager:
             return
         
         # 继续解锁流程（设备现在应该在fastboot模式）
+        if self.confirm_and_unlock(device_mode):
+            input("\n按回车键返回主菜单...")
+    
+    def confirm_and_unlock(self, device_mode):
+        """解锁确认和解锁步骤（设备已在 Fastboot 中；指定了 self.serial 时只针对该设备），取消时返回 False"""
         print("\n" + "═" * 60)
         print("警告：此操作有风险！")
         print("1. 会清除设备所有数据")
@@ -617,18 +3149,18 @@ class DeviceManager:
         confirm = input("确认要解锁Bootloader吗？(yes/no): ").strip().lower()
         if confirm != 'yes':
             print("已取消解锁操作")
-            time.sleep(1)
-            return
+            self.pause(1)
+            return False
         
         # 输入解锁码
         unlock_code = input("\n请输入解锁码: ").strip()
         if not unlock_code:
             print("解锁码不能为空！")
-            time.sleep(2)
-            return
+            self.pause(2)
+            return False
         
         print("\n正在准备解锁...")
-        time.sleep(1)
+        self.pause(1)
         
         # 模拟解锁过程
         steps = [
@@ -641,7 +3173,7 @@ class DeviceManager:
         
         for step, duration in steps:
             print(f"[{datetime.now().strftime('%H:%M:%S')}] {step}...")
-            time.sleep(duration)
+            self.pause(duration)
             
             # 如果是发送解锁命令，尝试执行fastboot命令
             if step == "发送解锁命令" and device_mode == 'fastboot':
@@ -665,12 +3197,12 @@ class DeviceManager:
         reboot = input("\n是否重启到系统？(y/n): ").strip().lower()
         if reboot == 'y':
             try:
-                result = subprocess.run('fastboot reboot', shell=True, capture_output=True, text=True)
+                argv = ['fastboot'] + (['-s', self.serial] if self.serial else []) + ['reboot']
+                result = subprocess.run(argv, capture_output=True, text=True)
                 print(f"重启命令结果: {result.stdout}")
             except:
                 print("重启失败")
-        
-        input("\n按回车键返回主菜单...")
+        return True
     
     def main_menu(self):
         """主菜单（原有功能保持不变）"""
@@ -684,11 +3216,13 @@ class DeviceManager:
             print("1. 扫描设备信息（含精确生产日期）")  # 修改了提示文字
             print("2. 获取Bootloader解锁码")
             print("3. 解锁Bootloader（新增模式检测）")
-            print("4. 切换模式")
-            print("5. 退出程序")
+            print("4. 多设备并行扫描")
+            print("5. 批量进入Fastboot")
+            print("6. 切换模式")
+            print("7. 退出程序")
             print("═" * 50)
             
-            choice = input("请选择操作 (1-5): ").strip()
+            choice = input("请选择操作 (1-7): ").strip()
             
             if choice == '1':
                 if self.mode == 'adb' and not self.check_adb_connection():
@@ -701,27 +3235,380 @@ class DeviceManager:
                 # 这里不再调用 check_adb_connection()，而是让 unlock_bootloader() 自己检测
                 self.unlock_bootloader()  # 修改后的功能
             elif choice == '4':
-                self.select_mode()
+                self.fleet_scan()
             elif choice == '5':
+                self.stage_fleet()
+            elif choice == '6':
+                self.select_mode()
+            elif choice == '7':
                 print("感谢使用，再见！")
                 sys.exit(0)
             else:
                 print("无效选择，请重新输入！")
-                time.sleep(1)
+                self.pause(1)
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="设备管理工具")
+    parser.add_argument('--no-delay', action='store_true',
+                        help="去掉所有展示用的等待，适合脚本化运行")
+    parser.add_argument('--fastboot-timeout', type=float, default=None,
+                        help=f"等待设备进入Fastboot的最长秒数（默认 {DeviceManager.FASTBOOT_WAIT_TIMEOUT}）")
+    parser.add_argument('--trace', metavar='FILE', default=None,
+                        help="扫描后把每条命令的计时导出到文件")
+    parser.add_argument('--trace-format', choices=['chrome', 'json'], default='chrome',
+                        help="时间线格式：chrome（chrome://tracing / Perfetto）或 json（默认 chrome）")
+    parser.add_argument('--full-scan', action='store_true',
+                        help="每次扫描都重新获取全部信息，不使用静态信息缓存")
+    parser.add_argument('--export', metavar='FILE', default=None,
+                        help="每扫描完一台设备就把结果追加到文件（JSON Lines 或 CSV）")
+    parser.add_argument('--export-format', choices=ScanExporter.FORMATS, default=None,
+                        help="导出格式（默认按扩展名：.csv 为 CSV，其余为 JSON Lines）")
+    parser.add_argument('--dumpsys-bulk', action='store_true',
+                        help="扫描时一次抓取完整 dumpsys 到本地文件，dumpsys 类探测都从文件读取")
+    parser.add_argument('--dumpsys-services', metavar='LIST', default=None,
+                        help="只批量抓取这些服务（逗号分隔，如 battery,iphonesubinfo），隐含 --dumpsys-bulk")
+    parser.add_argument('--dumpsys-dir', metavar='DIR', default=None,
+                        help="保留批量 dumpsys 文件的目录（默认扫描后删除）")
+    parser.add_argument('--record', metavar='DIR', default=None,
+                        help="录制每次扫描的设备端命令及原始输出，每台设备一个压缩档案写入该目录")
+    parser.add_argument('--db', metavar='FILE', default=None,
+                        help="扫描历史库（SQLite），每次扫描自动追加一条记录")
+    history = parser.add_argument_group("扫描历史查询（需要 --db，执行后直接退出）")
+    history.add_argument('--import-reports', nargs='+', metavar='PATH', default=None,
+                         help="导入已有的 txt 扫描报告（文件或目录）")
+    history.add_argument('--history-sn', metavar='SN', default=None, help="某个 SN 最近一次的扫描")
+    history.add_argument('--history-imei', metavar='IMEI', default=None, help="含有某个 IMEI 的所有扫描")
+    history.add_argument('--history-model', metavar='MODEL', default=None, help="某个型号扫描过的设备")
+    history.add_argument('--history-days', type=float, default=7,
+                         help="--history-model 只看最近多少天（默认 7）")
+    history.add_argument('--duplicate-imeis', action='store_true', help="列出出现在多个 SN 上的 IMEI")
+    
+    # 无界面命令：不显示横幅、不清屏、不等待输入，结果写到标准输出，进度和错误写到标准错误
+    commands = parser.add_subparsers(dest='command', metavar='命令',
+                                     help="无界面运行（不指定时进入交互菜单）")
+    scan = commands.add_parser('scan', help="扫描设备信息并按行输出")
+    scan.add_argument('--mode', choices=['adb', 'local', 'fastboot'], default='adb',
+                      help="扫描模式（默认 adb；fastboot 用 getvar all 扫描处于 Fastboot 的设备）")
+    scan.add_argument('-s', '--serial', action='append', default=None,
+                      help="要扫描的设备序列号，可重复指定")
+    scan.add_argument('--all', action='store_true', help="扫描所有已连接的 adb 设备")
+    scan.add_argument('--format', choices=ScanExporter.FORMATS, default='jsonl', help="输出格式（默认 jsonl）")
+    scan.add_argument('-o', '--output', default='-', help="输出文件（默认标准输出，文件已存在时追加）")
+    scan.add_argument('--replay', nargs='+', metavar='PATH', default=None,
+                      help="不连接设备，用录制档案（文件或目录）回放扫描")
+    scan.add_argument('--workers', type=int, default=None,
+                      help=f"同时扫描的设备数（默认 {DeviceManager.FLEET_MAX_WORKERS}）")
+    scan.add_argument('--stream', action='store_true',
+                      help="每得到一项就输出一行 {\"event\": \"field\"}（仅 jsonl），整台设备的记录照常输出")
+    detect = commands.add_parser('detect', help="检测所有设备及其模式")
+    detect.add_argument('--timeout', type=float, default=None,
+                        help=f"每个探测的超时秒数（默认 {DeviceManager.DETECT_TIMEOUT}）")
+    detect.add_argument('--format', choices=['text', 'jsonl'], default='text', help="输出格式（默认 text）")
+    stage = commands.add_parser('stage', help="批量重启到 Fastboot 并确认就绪（不执行解锁）")
+    stage.add_argument('-s', '--serial', action='append', default=None, help="设备序列号，可重复指定")
+    stage.add_argument('--all', action='store_true', help="处理所有已连接的设备（含已在 Fastboot 的）")
+    stage.add_argument('--parallel', type=int, default=None,
+                       help=f"最多同时重启的设备数（默认 {DeviceManager.FLEET_MAX_WORKERS}）")
+    stage.add_argument('--deadline', type=float, default=None,
+                       help=f"每台设备进入 Fastboot 的最长秒数（默认 {DeviceManager.FASTBOOT_WAIT_TIMEOUT}）")
+    stage.add_argument('--format', choices=['text', 'jsonl'], default='text', help="输出格式（默认 text）")
+    watch = commands.add_parser('watch', help="持续监听设备接入、断开和模式变化")
+    watch.add_argument('--interval', type=float, default=1.0, help="检查间隔秒数（默认 1）")
+    watch.add_argument('--duration', type=float, default=None, help="监听多少秒后退出（默认一直监听）")
+    watch.add_argument('--format', choices=['text', 'jsonl'], default='text', help="输出格式（默认 text）")
+    decode = commands.add_parser('decode-sn', help="批量推算库存 CSV 中各 SN 的生产日期（不连接设备）")
+    decode.add_argument('input', help="输入 CSV 文件（- 表示标准输入）")
+    decode.add_argument('-o', '--output', default='-', help="输出 CSV 文件（默认标准输出）")
+    decode.add_argument('--column', default='sn', help="SN 所在列的表头（默认 sn）")
+    decode.add_argument('--chunk-size', type=int, default=65536, help="每批解析的行数（默认 65536）")
+    return parser.parse_args(argv)
+
+def print_history_scan(scan):
+    """显示一条历史扫描记录"""
+    serial = f"  设备 {scan['serial']}" if scan['serial'] else ''
+    print(f"\n[{scan['scanned_at']}]{serial}")
+    for item, data in scan['info_items'].items():
+        print(f"  {item}: {data['value']}")
+    for item, value in scan['device_info'].items():
+        print(f"  {item}: {value}")
+
+def run_history_command(store, args):
+    """执行扫描历史相关的命令行操作，执行了任何操作时返回 True"""
+    handled = False
+    if args.import_reports:
+        handled = True
+        results = store.import_reports(args.import_reports)
+        for path, count in results.items():
+            print(f"{path}: 导入 {count} 条")
+        print(f"共导入 {sum(results.values())} 条扫描记录")
+    if args.history_sn:
+        handled = True
+        scan = store.latest_scan(args.history_sn)
+        if scan:
+            print_history_scan(scan)
+        else:
+            print(f"没有 SN {args.history_sn} 的扫描记录")
+    if args.history_imei:
+        handled = True
+        scans = store.scans_by_imei(args.history_imei)
+        print(f"IMEI {args.history_imei} 共 {len(scans)} 条扫描记录")
+        for scan in scans:
+            print_history_scan(scan)
+    if args.history_model:
+        handled = True
+        since = datetime.fromtimestamp(time.time() - args.history_days * 86400)
+        scans = store.devices_by_model(args.history_model, since)
+        print(f"型号 {args.history_model} 最近 {args.history_days:g} 天扫描过 {len(scans)} 台设备")
+        print(f"{'最近扫描':<22}{'SN':<20}{'IMEI1'}")
+        for scan in scans:
+            sn = scan['sn'] or "无法获取"
+            imei = scan['info_items'].get('IMEI1', {}).get('value', "无法获取")
+            print(f"{scan['scanned_at']:<22}{sn:<20}{imei}")
+    if args.duplicate_imeis:
+        handled = True
+        duplicates = store.duplicate_imeis()
+        print(f"出现在多个 SN 上的 IMEI: {len(duplicates)} 个")
+        for imei, sns in duplicates:
+            print(f"  {imei}: {', '.join(sns)}")
+    return handled
+
+# 无界面命令的退出码
+EXIT_OK = 0  # 全部成功
+EXIT_FAILED = 1  # 有设备扫描失败
+EXIT_USAGE = 2  # 参数错误（与 argparse 一致）
+EXIT_NO_DEVICE = 3  # 没有找到设备
+
+def log(message):
+    """无界面命令的提示信息写到标准错误，不混入标准输出的数据"""
+    print(message, file=sys.stderr, flush=True)
+
+def headless_scan(manager, args):
+    """scan 命令：扫描一台或多台设备，每台设备扫描完立即输出一行（--stream 时每一项都立即输出）"""
+    if args.stream and (args.format == 'csv' or args.mode == 'fastboot' or args.replay):
+        log("--stream 只支持 jsonl 格式的 adb / local 扫描")
+        return EXIT_USAGE
+    manager.exporter = ScanExporter(args.output, args.format, DeviceManager.export_columns())
+    
+    def on_field(serial, section, item, data, elapsed):
+        if item is not None:
+            manager.exporter.write_field(section, item, data, serial, elapsed)
+    
+    def on_result(result):
+        # 结果已逐台导出，这里只写历史库，汇总只需要知道这台是否失败
+        if result['error']:
+            log(f"{result['serial']}: {result['error']}")
+        else:
+            manager.record_scan(result['info_items'], result['device_info'], result['serial'], result.get('mode'))
+        # 出错或型号、SN 都没拿到（设备不存在、未授权等）都算失败
+        return bool(result['error']) or not any(result['info_items'].get(item, {}).get('status') == '✓'
+                                                for item in ('设备型号', '序列号(SN)'))
+    
+    try:
+        if args.mode == 'local':
+            start = time.monotonic()
+            on_local_field = lambda section, item, data: on_field(None, section, item, data, time.monotonic() - start)
+            info_items = manager.collect_scan(verbose=False, on_field=on_local_field if args.stream else None)
+            manager.export_scan(info_items, manager.device_info, elapsed=time.monotonic() - start,
+                                error=manager.scan_error())
+            manager.record_scan(info_items, manager.device_info)
+            return EXIT_OK
+        
+        if args.replay:
+            archives = CaptureArchive.find(args.replay)
+            if not archives:
+                log("没有找到录制档案")
+                return EXIT_NO_DEVICE
+            start = time.monotonic()
+            failed = manager.run_fleet(manager.scan_replay, archives, args.workers, verbose=False, on_result=on_result)
+            log(f"回放完成: {len(failed)} 个档案，失败 {sum(failed)} 个，耗时 {time.monotonic() - start:.1f}s")
+            return EXIT_FAILED if any(failed) else EXIT_OK
+        
+        fastboot = args.mode == 'fastboot'
+        serials = args.serial
+        if not serials:
+            serials = manager.list_fastboot_serials() if fastboot else manager.list_adb_serials()
+            if not serials:
+                log("未找到连接的设备")
+                return EXIT_NO_DEVICE
+            if len(serials) > 1 and not args.all:
+                log(f"检测到 {len(serials)} 台设备，请用 --serial 指定或用 --all 全部扫描")
+                return EXIT_USAGE
+        
+        start = time.monotonic()
+        if fastboot:
+            failed = manager.scan_fastboot_fleet(serials, args.workers, verbose=False, on_result=on_result)
+        else:
+            failed = manager.scan_fleet(serials, args.workers, verbose=False,
+                                        on_field=on_field if args.stream else None, on_result=on_result)
+        log(f"扫描完成: {len(failed)} 台设备，失败 {sum(failed)} 台，耗时 {time.monotonic() - start:.1f}s")
+        return EXIT_FAILED if any(failed) else EXIT_OK
+    finally:
+        manager.exporter.close()
+        manager.exporter = None
+        if manager.trace_path:
+            manager.tracer.export(manager.trace_path, manager.trace_format)
+
+def print_device_line(fmt, serial, mode, event=None):
+    if fmt == 'jsonl':
+        record = {'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'serial': serial, 'mode': mode}
+        if event:
+            record['event'] = event
+        print(json.dumps(record, ensure_ascii=False), flush=True)
+    else:
+        print('\t'.join(([event] if event else []) + [serial, mode]), flush=True)
+
+def headless_detect(manager, args):
+    """detect 命令：列出所有设备及其模式（normal / fastboot / 9008）"""
+    detected = manager.detect_devices(args.timeout)
+    for serial, mode in detected:
+        print_device_line(args.format, serial, mode)
+    return EXIT_OK if detected else EXIT_NO_DEVICE
+
+def headless_watch(manager, args):
+    """watch 命令：每隔 interval 秒对比一次设备列表，输出 added / removed / changed 事件"""
+    manager.start_device_watcher()
+    deadline = time.monotonic() + args.duration if args.duration else None
+    known = {}
+    try:
+        while True:
+            current = dict(manager.detect_devices())
+            for serial, mode in current.items():
+                if serial not in known:
+                    print_device_line(args.format, serial, mode, 'added')
+                elif known[serial] != mode:
+                    print_device_line(args.format, serial, mode, 'changed')
+            for serial, mode in known.items():
+                if serial not in current:
+                    print_device_line(args.format, serial, mode, 'removed')
+            known = current
+            
+            if deadline is not None and time.monotonic() >= deadline:
+                return EXIT_OK
+            wait_time = args.interval if deadline is None else min(args.interval, deadline - time.monotonic())
+            time.sleep(max(wait_time, 0))
+    except KeyboardInterrupt:
+        return EXIT_OK
+
+def headless_stage(manager, args):
+    """stage 命令：并发把设备送进 Fastboot，每次状态变化输出一行；全部就绪时退出码为 0"""
+    serials = args.serial
+    if not serials:
+        serials = manager.list_adb_serials() + manager.list_fastboot_serials()
+        if not serials:
+            log("未找到连接的设备")
+            return EXIT_NO_DEVICE
+        if len(serials) > 1 and not args.all:
+            log(f"检测到 {len(serials)} 台设备，请用 --serial 指定或用 --all 全部处理")
+            return EXIT_USAGE
+    
+    def on_change(serial, state, counts):
+        if args.format == 'jsonl':
+            record = {'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'serial': serial, 'state': state}
+            record.update((key, value) for key, value in stager.details[serial].items() if key != 'info_items')
+            print(json.dumps(record, ensure_ascii=False), flush=True)
+        else:
+            print(f"{serial}\t{state}", flush=True)
+        log('  '.join(f"{state} {count}" for state, count in counts.items() if count))
+    
+    stager = FleetStager(manager, serials, args.parallel, args.deadline, on_change)
+    states = stager.run()
+    return EXIT_OK if all(state == 'ready' for state in states.values()) else EXIT_FAILED
+
+def headless_decode_sn(manager, args):
+    """decode-sn 命令：流式读入库存 CSV，追加生产日期列后写出"""
+    source = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8-sig', newline='')
+    # utf-8-sig 让 Excel 正确识别中文表头
+    target = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8-sig', newline='')
+    try:
+        total = SnDateDecoder().decode_csv(source, target, args.column, max(args.chunk_size, 1))
+    except ValueError as e:
+        log(str(e))
+        return EXIT_USAGE
+    finally:
+        for f in (source, target):
+            if f not in (sys.stdin, sys.stdout):
+                f.close()
+    log(f"已解析 {total} 行")
+    return EXIT_OK
+
+def apply_dumpsys_args(manager, args):
+    """批量 dumpsys 相关的命令行参数"""
+    if args.dumpsys_services:
+        manager.dumpsys_bulk = [name.strip() for name in args.dumpsys_services.split(',') if name.strip()]
+    elif args.dumpsys_bulk:
+        manager.dumpsys_bulk = []
+    manager.dumpsys_dir = args.dumpsys_dir
+
+def run_headless(args, store=None):
+    """执行无界面命令，返回退出码"""
+    manager = DeviceManager(mode=getattr(args, 'mode', 'adb'), no_delay=True,
+                            fastboot_timeout=args.fastboot_timeout)
+    manager.trace_path = args.trace
+    manager.trace_format = args.trace_format
+    manager.scan_store = store
+    manager.use_static_cache = not args.full_scan
+    manager.capture_dir = args.record
+    apply_dumpsys_args(manager, args)
+    handlers = {'scan': headless_scan, 'detect': headless_detect, 'stage': headless_stage,
+                'watch': headless_watch, 'decode-sn': headless_decode_sn}
+    try:
+        return handlers[args.command](manager, args)
+    finally:
+        manager.stop_device_watcher()
+        manager.close_shell_session()
 
 def main():
     """主函数"""
+    args = parse_args()
+    store = ScanStore(args.db) if args.db else None
+    if store is None and (args.import_reports or args.history_sn or args.history_imei
+                          or args.history_model or args.duplicate_imeis):
+        log("扫描历史查询需要用 --db 指定历史库")
+        sys.exit(EXIT_USAGE)
+    if store and run_history_command(store, args):
+        store.close()
+        return
+    if args.command:
+        # 无界面命令出错时直接以退出码结束，不等待回车
+        try:
+            code = run_headless(args, store)
+        except Exception as e:
+            log(f"程序运行出错: {e}")
+            code = EXIT_FAILED
+        finally:
+            if store:
+                store.close()
+        sys.exit(code)
+    
     print("设备管理工具 v1.0")
     print("=" * 50)
     
-    manager = DeviceManager()
-    
-    # 选择模式
-    if not manager.select_mode():
-        return
+    manager = DeviceManager(no_delay=args.no_delay, fastboot_timeout=args.fastboot_timeout)
+    manager.trace_path = args.trace
+    manager.trace_format = args.trace_format
+    manager.scan_store = store
+    manager.use_static_cache = not args.full_scan
+    manager.capture_dir = args.record
+    apply_dumpsys_args(manager, args)
+    if args.export:
+        manager.exporter = ScanExporter(args.export, args.export_format, DeviceManager.export_columns())
+    manager.start_device_watcher()
     
-    # 进入主菜单
-    manager.main_menu()
+    try:
+        # 选择模式
+        if not manager.select_mode():
+            return
+        
+        # 进入主菜单
+        manager.main_menu()
+    finally:
+        manager.stop_device_watcher()
+        manager.close_shell_session()
+        if store:
+            store.close()
+        if manager.exporter:
+            manager.exporter.close()
 
 if __name__ == "__main__":
     try: